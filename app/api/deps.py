@@ -1,18 +1,33 @@
+import asyncio
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.database import get_db
+from app.core.config import settings
+from app.database.database import get_async_db
 from app.core.security import verify_access_token
-from app.repositories.user_repository import UserRepository
+from app.repositories.async_repositories import AsyncUserRepository
+from app.repositories.token_versions import token_versions
 
 security = HTTPBearer()
+# Для необязательной аутентификации: без заголовка Authorization возвращает None вместо 403
+optional_security = HTTPBearer(auto_error=False)
+# Первая загрузка версий токенов выполняется одним запросом, остальные ждут ее
+_token_versions_load_lock = asyncio.Lock()
 
 
-def get_current_user(
+def _revoked_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token has been revoked",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user(
         credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ) -> dict:
     """Получает текущего пользователя из JWT токена"""
     token = credentials.credentials
@@ -24,13 +39,33 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user_repo = UserRepository(db)
-    user = user_repo.get_by_id(payload.get("sub"))
+    # Stateless-режим: подписанным claims доверяем, сверяется только версия токенов
+    if settings.stateless_auth and "ver" in payload:
+        # Дальше версии обновляет фоновая задача token_version_refresh
+        if not token_versions.loaded:
+            async with _token_versions_load_lock:
+                if not token_versions.loaded:
+                    await db.run_sync(token_versions.load)
+        if payload["ver"] != token_versions.get(payload["sub"]):
+            raise _revoked_token()
+
+        return {
+            "id": payload["sub"],
+            "email": payload["email"],
+            "name": payload["name"],
+            "phone": payload.get("phone"),
+            "is_superuser": payload.get("is_superuser", False)
+        }
+
+    user_repo = AsyncUserRepository(db)
+    user = await user_repo.get_by_id(payload.get("sub"))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
         )
+    if "ver" in payload and payload["ver"] != user.token_version:
+        raise _revoked_token()
 
     return {
         "id": user.id,
@@ -61,15 +96,15 @@ def get_current_superuser(current_user: dict = Depends(get_current_user)) -> dic
     return current_user
 
 
-def get_optional_user(
-        credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-        db: Session = Depends(get_db)
+async def get_optional_user(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+        db: AsyncSession = Depends(get_async_db)
 ) -> Optional[dict]:
     """Получает пользователя если токен есть, но не требует аутентификации"""
     if not credentials:
         return None
 
     try:
-        return get_current_user(credentials, db)
+        return await get_current_user(credentials, db)
     except HTTPException:
         return None
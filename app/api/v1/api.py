@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import products, category, auth, favorites, cart
+from app.api.v1.endpoints import products, category, auth, favorites, cart, search
 
 api_router = APIRouter()
 
@@ -9,3 +9,4 @@ api_router.include_router(category.router, prefix="/categories", tags=["categori
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(favorites.router, prefix="/favorites", tags=["favorites"])
 api_router.include_router(cart.router, prefix="/cart", tags=["cart"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
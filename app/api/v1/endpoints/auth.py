@@ -1,9 +1,9 @@
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_active_user
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.schemas.auth import (
     UserCreate,
     UserLogin,
@@ -11,9 +11,12 @@ from app.schemas.auth import (
     Token,
     RefreshTokenRequest
 )
-from app.repositories.user_repository import UserRepository
-from app.repositories.refresh_token_repository import RefreshTokenRepository
+from app.repositories.async_repositories import AsyncUserRepository, AsyncRefreshTokenRepository
+from app.repositories.last_login_buffer import last_login_buffer
+from app.repositories.token_versions import token_versions
+from app.core.password_hasher import password_hasher, PasswordHasherBusy
 from app.core.security import (
+    user_token_data,
     create_access_token,
     create_refresh_token,
     get_token_expiration
@@ -22,38 +25,48 @@ from app.core.security import (
 router = APIRouter()
 
 
+def _hasher_busy(error: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, try again later",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(
         user_data: UserCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    user_repo = UserRepository(db)
-    refresh_token_repo = RefreshTokenRepository(db)
+    user_repo = AsyncUserRepository(db)
+    refresh_token_repo = AsyncRefreshTokenRepository(db)
 
     # Проверяем, нет ли пользователя с таким email
-    existing_user = user_repo.get_by_email(user_data.email)
+    existing_user = await user_repo.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email already exists"
         )
 
+    # Хешируем пароль в пуле потоков, не блокируя event loop
+    user_dict = user_data.dict()
+    try:
+        user_dict["hashed_password"] = await password_hasher.hash(user_dict.pop("password"))
+    except PasswordHasherBusy as e:
+        raise _hasher_busy(e)
+
     # Создаем пользователя
-    user = user_repo.create(user_data.dict())
+    user = await user_repo.create(user_dict)
 
     # Создаем access token
-    user_token_data = {
-        "id": str(user.id),
-        "email": user.email,
-        "name": user.name
-    }
-    access_token = create_access_token(user_token_data)
+    access_token = create_access_token(user_token_data(user))
 
     refresh_token = create_refresh_token()
     expires_at = get_token_expiration("refresh")
 
     # Сохраняем refresh token в базе
-    refresh_token_repo.create(str(user.id), refresh_token, expires_at)
+    await refresh_token_repo.create(str(user.id), refresh_token, expires_at)
 
     return {
         "access_token": access_token,
@@ -65,36 +78,46 @@ async def register(
 @router.post("/login", response_model=Token)
 async def login(
         login_data: UserLogin,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    user_repo = UserRepository(db)
-    refresh_token_repo = RefreshTokenRepository(db)
-
-    # Аутентифицируем пользователя
-    user = user_repo.authenticate(login_data.email, login_data.password)
-    if not user:
+    user_repo = AsyncUserRepository(db)
+    refresh_token_repo = AsyncRefreshTokenRepository(db)
+
+    # Аутентифицируем пользователя; bcrypt выполняется в пуле потоков
+    user = await user_repo.get_by_email(login_data.email)
+    password_valid, new_hash = False, None
+    if user and user.hashed_password:
+        try:
+            password_valid, new_hash = await password_hasher.verify_and_update(
+                login_data.password, user.hashed_password
+            )
+        except PasswordHasherBusy as e:
+            raise _hasher_busy(e)
+
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
 
-    # Обновляем время последнего входа
-    user_repo.update_last_login(user.id)
+    # Хеш со старой стоимостью bcrypt заменяется пересчитанным
+    if new_hash:
+        await user_repo.update_password_hash(user, new_hash)
+
+    # Обновляем время последнего входа: через буфер отложенной записи, при его переполнении - сразу
+    logged_in_at = datetime.utcnow()
+    if not last_login_buffer.record(user.id, logged_in_at):
+        await user_repo.update_last_login(user.id, logged_in_at)
 
     # Создаем access token
-    user_data = {
-        "id": str(user.id),
-        "email": user.email,
-        "name": user.name
-    }
-    access_token = create_access_token(user_data)
+    access_token = create_access_token(user_token_data(user))
 
     # Создаем refresh token
     refresh_token = create_refresh_token()
     expires_at = get_token_expiration("refresh")
 
     # Сохраняем refresh token в базе
-    refresh_token_repo.create(str(user.id), refresh_token, expires_at)
+    await refresh_token_repo.create(str(user.id), refresh_token, expires_at)
 
     return {
         "access_token": access_token,
@@ -106,50 +129,31 @@ async def login(
 @router.post("/refresh", response_model=Token)
 async def refresh_token(
         refresh_data: RefreshTokenRequest,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    refresh_token_repo = RefreshTokenRepository(db)
-    user_repo = UserRepository(db)
+    refresh_token_repo = AsyncRefreshTokenRepository(db)
+    user_repo = AsyncUserRepository(db)
 
-    # Проверяем refresh token
-    if not refresh_token_repo.is_valid(refresh_data.refresh_token):
+    # Отзываем старый refresh token и сохраняем новый в одной транзакции
+    new_refresh_token = create_refresh_token()
+    expires_at = get_token_expiration("refresh")
+    user_id = await refresh_token_repo.rotate(refresh_data.refresh_token, new_refresh_token, expires_at)
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token"
         )
 
-    # Получаем токен из базы
-    token_obj = refresh_token_repo.get_by_token(refresh_data.refresh_token)
-    if not token_obj:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Refresh token not found"
-        )
-
     # Получаем пользователя
-    user = user_repo.get_by_id(token_obj.user_id)
+    user = await user_repo.get_by_id(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
 
-    # Отзываем старый refresh token
-    refresh_token_repo.revoke(refresh_data.refresh_token)
-
-    # Создаем новые токены
-    user_data = {
-        "id": str(user.id),
-        "email": user.email,
-        "name": user.name
-    }
-    access_token = create_access_token(user_data)
-
-    new_refresh_token = create_refresh_token()
-    expires_at = get_token_expiration("refresh")
-
-    # Сохраняем новый refresh token
-    refresh_token_repo.create(str(user.id), new_refresh_token, expires_at)
+    # Создаем новый access token
+    access_token = create_access_token(user_token_data(user))
 
     return {
         "access_token": access_token,
@@ -161,12 +165,12 @@ async def refresh_token(
 @router.post("/logout")
 async def logout(
         refresh_data: RefreshTokenRequest,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    refresh_token_repo = RefreshTokenRepository(db)
+    refresh_token_repo = AsyncRefreshTokenRepository(db)
 
     # Отзываем refresh token
-    success = refresh_token_repo.revoke(refresh_data.refresh_token)
+    success = await refresh_token_repo.revoke(refresh_data.refresh_token)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -176,11 +180,27 @@ async def logout(
     return {"message": "Successfully logged out"}
 
 
+@router.post("/logout-all")
+async def logout_all(
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    user_repo = AsyncUserRepository(db)
+    refresh_token_repo = AsyncRefreshTokenRepository(db)
+
+    # Отзываем все refresh token и делаем недействительными выданные access token
+    await refresh_token_repo.revoke_all_user_tokens(current_user["id"])
+    version = await user_repo.increment_token_version(current_user["id"])
+    token_versions.set(current_user["id"], version)
+
+    return {"message": "Logged out from all devices"}
+
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    user_repo = UserRepository(db)
-    user = user_repo.get_by_id(current_user["id"])
+    user_repo = AsyncUserRepository(db)
+    user = await user_repo.get_by_id(current_user["id"])
     return user
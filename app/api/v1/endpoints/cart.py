@@ -1,14 +1,23 @@
+from datetime import timedelta
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_active_user
-from app.database.database import get_db
-from app.repositories.cart_repository import CartRepository
-from app.repositories.product_repository import ProductRepository
+from app.core.config import settings
+from app.database.database import get_async_db
+from app.repositories.async_repositories import (
+    AsyncCartRepository,
+    AsyncProductRepository,
+    AsyncStockReservationRepository
+)
 from app.schemas.cart import (
     CartItemCreate,
     CartItemUpdate,
+    CartBatchUpdate,
     CartResponse,
+    CartReservationResponse,
+    CartCheckoutResponse,
     CartSummary
 )
 
@@ -18,89 +27,102 @@ router = APIRouter()
 @router.get("/", response_model=CartResponse)
 async def get_cart(
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
+    cart_repo = AsyncCartRepository(db)
 
-    cart_items = cart_repo.get_user_cart_with_products(current_user["id"])
-    total = cart_repo.get_cart_total(current_user["id"])
-    items_count = cart_repo.get_cart_items_count(current_user["id"])
+    cart = await cart_repo.get_cart(current_user["id"])
 
-    return CartResponse(
-        items=cart_items,
-        total=total,
-        items_count=items_count
-    )
+    return CartResponse(**cart)
 
 
 @router.post("/items", status_code=status.HTTP_201_CREATED)
 async def add_to_cart(
         cart_item: CartItemCreate,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
-    product_repo = ProductRepository(db)
+    cart_repo = AsyncCartRepository(db)
+    product_repo = AsyncProductRepository(db)
 
-    # Проверяем существование продукта
-    product = product_repo.get_by_id(cart_item.product_id)
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
+    # Добавляем одним запросом с проверкой остатка с учетом уже лежащего в корзине
+    cart_item_id = await cart_repo.add_item(
+        current_user["id"],
+        cart_item.product_id,
+        cart_item.quantity
+    )
 
-    # Проверяем доступное количество
-    if product.stock_quantity < cart_item.quantity:
+    if not cart_item_id:
+        # Товар не добавлен: выясняем причину
+        if not await product_repo.get_by_id(cart_item.product_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Not enough stock available"
         )
 
-    cart_item_obj = cart_repo.add_to_cart(
-        current_user["id"],
-        cart_item.product_id,
-        cart_item.quantity
-    )
-
     return {
         "message": "Product added to cart",
-        "cart_item_id": cart_item_obj.id
+        "cart_item_id": cart_item_id
     }
 
 
-@router.put("/items/{product_id}")
-async def update_cart_item(
-        product_id: str,
-        cart_update: CartItemUpdate,
+@router.patch("/items", response_model=CartResponse)
+async def update_cart_items(
+        batch: CartBatchUpdate,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
-    product_repo = ProductRepository(db)
+    cart_repo = AsyncCartRepository(db)
 
-    # Проверяем существование продукта
-    product = product_repo.get_by_id(product_id)
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
+    # Все изменения применяются в одной транзакции, либо ни одно
+    try:
+        cart = await cart_repo.apply_operations(
+            current_user["id"],
+            [operation.dict() for operation in batch.operations]
         )
-
-    # Проверяем доступное количество
-    if product.stock_quantity < cart_update.quantity:
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Not enough stock available"
+            detail=str(e)
         )
 
-    cart_item = cart_repo.update_cart_item_quantity(
+    return CartResponse(**cart)
+
+
+@router.put("/items/{product_id}")
+async def update_cart_item(
+        product_id: str,
+        cart_update: CartItemUpdate,
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    cart_repo = AsyncCartRepository(db)
+    reservation_repo = AsyncStockReservationRepository(db)
+
+    # Условный UPDATE: меняет количество, только если товар в корзине и доступного остатка хватает
+    updated = await cart_repo.set_item_quantity(
         current_user["id"],
         product_id,
         cart_update.quantity
     )
 
-    if not cart_item:
+    if not updated:
+        # Количество не изменено: выясняем причину
+        available = await reservation_repo.get_available(product_id)
+        if available is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        if available < cart_update.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Not enough stock available"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found in cart"
@@ -113,11 +135,11 @@ async def update_cart_item(
 async def remove_from_cart(
         product_id: str,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
+    cart_repo = AsyncCartRepository(db)
 
-    success = cart_repo.remove_from_cart(current_user["id"], product_id)
+    success = await cart_repo.remove_from_cart(current_user["id"], product_id)
 
     if not success:
         raise HTTPException(
@@ -131,10 +153,10 @@ async def remove_from_cart(
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_cart(
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
-    cart_repo.clear_cart(current_user["id"])
+    cart_repo = AsyncCartRepository(db)
+    await cart_repo.clear_cart(current_user["id"])
 
     return None
 
@@ -142,14 +164,76 @@ async def clear_cart(
 @router.get("/summary", response_model=CartSummary)
 async def get_cart_summary(
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    cart_repo = CartRepository(db)
+    cart_repo = AsyncCartRepository(db)
 
-    total = cart_repo.get_cart_total(current_user["id"])
-    items_count = cart_repo.get_cart_items_count(current_user["id"])
+    cart = await cart_repo.get_cart(current_user["id"], include_items=False)
 
     return CartSummary(
-        total_price=total,
-        items_count=items_count
+        total_price=cart["total"],
+        items_count=cart["items_count"]
     )
+
+
+@router.post("/reservation", response_model=CartReservationResponse)
+async def reserve_cart(
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    cart_repo = AsyncCartRepository(db)
+    reservation_repo = AsyncStockReservationRepository(db)
+
+    cart = await cart_repo.get_cart(current_user["id"])
+    if not cart["items"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cart is empty"
+        )
+
+    # Все позиции резервируются вместе на время оформления, прежний резерв заменяется
+    try:
+        reservations = await reservation_repo.reserve_items(
+            current_user["id"],
+            {item["product_id"]: item["count"] for item in cart["items"]},
+            timedelta(seconds=settings.stock_reservation_ttl_seconds)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return CartReservationResponse(reservations=reservations)
+
+
+@router.delete("/reservation", status_code=status.HTTP_204_NO_CONTENT)
+async def release_cart_reservation(
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    reservation_repo = AsyncStockReservationRepository(db)
+    await reservation_repo.release_user(current_user["id"])
+
+    return None
+
+
+@router.post("/checkout", response_model=CartCheckoutResponse)
+async def checkout_cart(
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    cart_repo = AsyncCartRepository(db)
+    reservation_repo = AsyncStockReservationRepository(db)
+
+    # Продаются только зарезервированные позиции: резерв списывается из остатка
+    items = await reservation_repo.confirm_user(current_user["id"])
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No active reservation"
+        )
+
+    await cart_repo.clear_cart(current_user["id"])
+
+    return CartCheckoutResponse(items=items)
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, Query, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 
-from app.database.database import get_db
-from app.repositories.category_repository import CategoryRepository
+from app.database.database import get_async_db
+from app.repositories.async_repositories import AsyncCategoryRepository
 from app.schemas.category import (
     CategoryCreate,
     CategoryResponse,
@@ -17,24 +17,35 @@ router = APIRouter()
 @router.get("/", response_model=List[CategoryResponse])
 async def get_categories(
         include_children: bool = Query(False, description="Include children categories"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
-    categories = repo.get_all_categories(include_children=include_children)
+    repo = AsyncCategoryRepository(db)
+    categories = await repo.get_all_categories(include_children=include_children)
     return categories
 
 
 @router.get("/tree", response_model=List[CategoryTreeResponse])
-async def get_category_tree(db: Session = Depends(get_db)):
-    repo = CategoryRepository(db)
-    categories = repo.get_category_tree()
+async def get_category_tree(
+        root_id: Optional[str] = Query(None, description="Return only the subtree of this category"),
+        max_depth: Optional[int] = Query(None, ge=1, description="Number of tree levels to return"),
+        db: AsyncSession = Depends(get_async_db)
+):
+    repo = AsyncCategoryRepository(db)
+    categories = await repo.get_category_tree(root_id=root_id, max_depth=max_depth)
+
+    if root_id and not categories:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Category not found"
+        )
+
     return categories
 
 
 @router.get("/root", response_model=List[CategoryResponse])
-async def get_root_categories(db: Session = Depends(get_db)):
-    repo = CategoryRepository(db)
-    categories = repo.get_root_categories()
+async def get_root_categories(db: AsyncSession = Depends(get_async_db)):
+    repo = AsyncCategoryRepository(db)
+    categories = await repo.get_root_categories()
     return categories
 
 
@@ -42,13 +53,13 @@ async def get_root_categories(db: Session = Depends(get_db)):
 async def get_category(
         category_id: str,
         include_children: bool = Query(False, description="Include children categories"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
+    repo = AsyncCategoryRepository(db)
     if include_children:
-        category = repo.get_category_with_children(category_id)
+        category = await repo.get_category_with_children(category_id)
     else:
-        category = repo.get_by_id(category_id)
+        category = await repo.get_node(category_id)
 
     if not category:
         raise HTTPException(
@@ -62,22 +73,22 @@ async def get_category(
 @router.get("/{category_id}/children", response_model=List[CategoryResponse])
 async def get_category_children(
         category_id: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
-    children = repo.get_children(category_id)
+    repo = AsyncCategoryRepository(db)
+    children = await repo.get_children(category_id)
     return children
 
 
 @router.post("", response_model=CategoryResponse, status_code=status.HTTP_201_CREATED)
 async def create_category(
         category_data: CategoryCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
+    repo = AsyncCategoryRepository(db)
 
     # Проверяем уникальность названия
-    existing_category = repo.get_by_name(category_data.name)
+    existing_category = await repo.get_by_name(category_data.name)
     if existing_category:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -86,14 +97,14 @@ async def create_category(
 
     # Проверяем существование родительской категории
     if category_data.parent_id:
-        parent_category = repo.get_by_id(category_data.parent_id)
+        parent_category = await repo.get_by_id(category_data.parent_id)
         if not parent_category:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Parent category not found"
             )
 
-    category = repo.create(category_data.dict())
+    category = await repo.create(category_data.dict())
     return category
 
 
@@ -101,11 +112,11 @@ async def create_category(
 async def update_category(
         category_id: str,
         category_data: CategoryUpdate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
+    repo = AsyncCategoryRepository(db)
 
-    existing_category = repo.get_by_id(category_id)
+    existing_category = await repo.get_by_id(category_id)
     if not existing_category:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -114,7 +125,7 @@ async def update_category(
 
     # Проверяем уникальность названия
     if category_data.name and category_data.name != existing_category.name:
-        category_with_name = repo.get_by_name(category_data.name)
+        category_with_name = await repo.get_by_name(category_data.name)
         if category_with_name:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -129,26 +140,26 @@ async def update_category(
                 detail="Category cannot be parent of itself"
             )
 
-        parent_category = repo.get_by_id(category_data.parent_id)
+        parent_category = await repo.get_by_id(category_data.parent_id)
         if not parent_category:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Parent category not found"
             )
 
-    updated_category = repo.update(category_id, category_data.dict(exclude_unset=True))
+    updated_category = await repo.update(category_id, category_data.dict(exclude_unset=True))
     return updated_category
 
 
 @router.delete("/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_category(
         category_id: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
+    repo = AsyncCategoryRepository(db)
 
     try:
-        success = repo.delete(category_id)
+        success = await repo.delete(category_id)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -166,22 +177,22 @@ async def delete_category(
 @router.get("/search/{search_term}", response_model=List[CategoryResponse])
 async def search_categories(
         search_term: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = CategoryRepository(db)
-    categories = repo.search_categories(search_term)
+    repo = AsyncCategoryRepository(db)
+    categories = await repo.search_categories(search_term)
     return categories
 
 
 @router.post("/{category_id}/update-counters")
 async def update_category_counters(
         category_id: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Принудительное обновление счетчиков категории"""
-    repo = CategoryRepository(db)
+    repo = AsyncCategoryRepository(db)
 
-    category = repo.get_by_id(category_id)
+    category = await repo.get_by_id(category_id)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -189,10 +200,10 @@ async def update_category_counters(
         )
 
     # Обновляем product_count (включая дочерние категории)
-    product_count = repo.update_product_count(category_id)
+    product_count = await repo.update_product_count(category_id)
 
     # Обновляем children_count
-    repo.update_children_count(category_id)
+    await repo.update_children_count(category_id)
 
     return {
         "message": "Category counters updated successfully",
@@ -203,15 +214,13 @@ async def update_category_counters(
 
 @router.post("/update-all-counters")
 async def update_all_category_counters(
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Принудительное обновление всех счетчиков категорий"""
-    repo = CategoryRepository(db)
-    repo.update_all_product_counts()
-
-    # Обновляем children_count для всех категорий
-    categories = repo.get_all_categories()
-    for category in categories:
-        repo.update_children_count(category.id)
+    repo = AsyncCategoryRepository(db)
+    stats = await repo.rebuild_all_counters()
 
-    return {"message": "All category counters updated successfully"}
+    return {
+        "message": "All category counters updated successfully",
+        **stats
+    }
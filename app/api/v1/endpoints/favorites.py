@@ -1,32 +1,66 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_active_user
-from app.database.database import get_db
-from app.repositories.favorite_repository import FavoriteRepository
+from app.database.database import get_async_db
+from app.repositories.async_repositories import AsyncFavoriteRepository
 from app.schemas.favorite import (
     FavoriteCreate,
+    FavoriteCheckRequest,
+    FavoriteCheckResponse,
     FavoriteWithProductResponse,
-    FavoriteListResponse
+    FavoriteListResponse,
+    FavoriteBriefListResponse
 )
 
 router = APIRouter()
 
 
-@router.get("/", response_model=FavoriteListResponse)
+@router.get("/", response_model=Union[FavoriteListResponse, FavoriteBriefListResponse])
 async def get_user_favorites(
+        cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы; без него - первая страница"),
+        count: int = Query(20, ge=1, le=100),
+        fields: str = Query("full", regex="^(full|brief)$",
+                            description="full - продукт целиком, brief - без описания и изображений"),
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    favorite_repo = FavoriteRepository(db)
+    favorite_repo = AsyncFavoriteRepository(db)
+
+    # Страница и общее количество одним запросом; без cursor - первая страница
+    try:
+        result = await favorite_repo.get_favorites_page(
+            current_user["id"],
+            count=count,
+            cursor=cursor,
+            fields=fields
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    if fields == "brief":
+        return FavoriteBriefListResponse(**result)
+    return FavoriteListResponse(**result)
 
-    favorites_with_products = favorite_repo.get_user_favorites_with_products(current_user["id"])
-    total = favorite_repo.get_favorite_count(current_user["id"])
 
-    return FavoriteListResponse(
-        favorites=favorites_with_products,
-        total=total
+# Объявлен до /{product_id}, иначе POST /check попадет в добавление в избранное
+@router.post("/check", response_model=FavoriteCheckResponse)
+async def check_products_in_favorites(
+        request: FavoriteCheckRequest,
+        current_user: dict = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    favorite_repo = AsyncFavoriteRepository(db)
+
+    # Все товары страницы проверяются одним запросом
+    favorite_ids = await favorite_repo.get_favorite_product_ids(current_user["id"], request.product_ids)
+
+    return FavoriteCheckResponse(
+        favorites={product_id: product_id in favorite_ids for product_id in request.product_ids}
     )
 
 
@@ -34,18 +68,18 @@ async def get_user_favorites(
 async def add_to_favorites(
         product_id: str,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    favorite_repo = FavoriteRepository(db)
+    favorite_repo = AsyncFavoriteRepository(db)
 
     # Проверяем, не добавлен ли уже товар в избранное
-    if favorite_repo.is_product_in_favorites(current_user["id"], product_id):
+    if await favorite_repo.is_product_in_favorites(current_user["id"], product_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Product already in favorites"
         )
 
-    favorite = favorite_repo.add_to_favorites(current_user["id"], product_id)
+    favorite = await favorite_repo.add_to_favorites(current_user["id"], product_id)
 
     return {
         "message": "Product added to favorites",
@@ -57,11 +91,11 @@ async def add_to_favorites(
 async def remove_from_favorites(
         product_id: str,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    favorite_repo = FavoriteRepository(db)
+    favorite_repo = AsyncFavoriteRepository(db)
 
-    success = favorite_repo.remove_from_favorites(current_user["id"], product_id)
+    success = await favorite_repo.remove_from_favorites(current_user["id"], product_id)
 
     if not success:
         raise HTTPException(
@@ -76,11 +110,11 @@ async def remove_from_favorites(
 async def check_product_in_favorites(
         product_id: str,
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    favorite_repo = FavoriteRepository(db)
+    favorite_repo = AsyncFavoriteRepository(db)
 
-    is_favorite = favorite_repo.is_product_in_favorites(current_user["id"], product_id)
+    is_favorite = await favorite_repo.is_product_in_favorites(current_user["id"], product_id)
 
     return {"is_favorite": is_favorite}
 
@@ -88,14 +122,9 @@ async def check_product_in_favorites(
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_favorites(
         current_user: dict = Depends(get_current_active_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    favorite_repo = FavoriteRepository(db)
-    favorites = favorite_repo.get_user_favorites(current_user["id"])
-
-    for favorite in favorites:
-        db.delete(favorite)
-
-    db.commit()
+    favorite_repo = AsyncFavoriteRepository(db)
+    await favorite_repo.clear_favorites(current_user["id"])
 
     return None
\ No newline at end of file
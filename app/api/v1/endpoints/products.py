@@ -2,11 +2,18 @@ from typing import Optional
 from uuid import UUID
 
 from fastapi import Query, Depends, APIRouter, HTTPException, status
-from sqlmodel import Session
-
-from app.database.database import get_db
-from app.repositories.category_repository import CategoryRepository
-from app.repositories.product_repository import ProductRepository
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_superuser, get_optional_user, optional_security
+from app.core.config import settings
+from app.database.database import get_async_db
+from app.repositories.async_repositories import (
+    AsyncCategoryRepository,
+    AsyncFavoriteRepository,
+    AsyncProductRepository,
+    AsyncStockReservationRepository
+)
 from app.schemas.product import ProductResponse, ProductCreate, ProductUpdate
 
 router = APIRouter()
@@ -15,6 +22,7 @@ router = APIRouter()
 @router.get("/", response_model=dict)
 async def get_products(
         page: int = Query(1, ge=1),
+        cursor: Optional[str] = Query(None, description="Курсор следующей страницы; пустое значение - первая страница"),
         count: int = Query(10, ge=1, le=100),
         category: Optional[str] = Query(None),
         name: Optional[str] = Query(None),
@@ -22,19 +30,24 @@ async def get_products(
         max_price: Optional[float] = Query(None),
         sort: str = Query("id"),
         order: str = Query("asc", regex="^(asc|desc)$"),
-        db: Session = Depends(get_db)
+        total: str = Query("exact", regex="^(exact|estimate|none)$",
+                           description="Подсчет общего количества: exact, estimate или none"),
+        include_favorites: bool = Query(False, description="Добавить is_favorite для текущего пользователя"),
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+        db: AsyncSession = Depends(get_async_db)
 ):
     # Формируем все фильтры
     filters = {}
     if category:
-        category_repo = CategoryRepository(db)
-        category_exists = category_repo.get_by_id(category)
+        category_repo = AsyncCategoryRepository(db)
+        category_exists = await category_repo.get_by_id(category)
         if not category_exists:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Category not found"
             )
-        filters["category_id"] = category
+        # Фильтр по категории включает все её подкатегории
+        filters["category"] = category
     if name:
         filters["title"] = name
     if min_price is not None:
@@ -42,25 +55,57 @@ async def get_products(
     if max_price is not None:
         filters["max_price"] = max_price
 
-    repo = ProductRepository(db)
-    products = repo.get_paginated(page, count, filters, sort, order)
-    total = repo.get_total_count(filters)
+    repo = AsyncProductRepository(db)
+
+    # Страница и общее количество получаются одним запросом;
+    # в курсорном режиме стоимость страницы не зависит от её глубины
+    try:
+        result = await repo.get_page_with_total(
+            count, filters, sort, order,
+            page=page,
+            cursor=cursor,
+            total_mode=total
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    if include_favorites:
+        # Токен проверяется только здесь, чтобы обычный список не обращался к users.
+        # Избранное для всей страницы одним запросом; анонимному пользователю - false
+        favorite_ids = set()
+        current_user = await get_optional_user(credentials, db)
+        if current_user:
+            favorite_repo = AsyncFavoriteRepository(db)
+            favorite_ids = await favorite_repo.get_favorite_product_ids(
+                current_user["id"],
+                [product["id"] for product in result["products"]]
+            )
+        for product in result["products"]:
+            product["is_favorite"] = product["id"] in favorite_ids
 
-    return {
-        "products": products,
-        "page": page,
+    response = {
+        "products": result["products"],
+        "page": page if cursor is None else None,
         "count": count,
-        "total": total
+        "total": result["total"],
+        "total_exact": result["total_exact"]
     }
+    if cursor is not None:
+        response["next_cursor"] = result["next_cursor"]
+
+    return response
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(
         product_id: UUID,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = ProductRepository(db)
-    product = repo.get_by_id_with_category_name(str(product_id))
+    repo = AsyncProductRepository(db)
+    product = await repo.get_by_id_with_category_name(str(product_id))
 
     if not product:
         raise HTTPException(
@@ -74,20 +119,20 @@ async def get_product(
 @router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
 async def create_product(
         product_data: ProductCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = ProductRepository(db)
+    repo = AsyncProductRepository(db)
 
     # Если артикул указан вручную, проверяем его уникальность
     if product_data.article is not None:
-        existing_product = repo.get_by_article(product_data.article)
+        existing_product = await repo.get_by_article(product_data.article)
         if existing_product:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Product with this article already exists"
             )
 
-    product = repo.create(product_data.model_dump())
+    product = await repo.create(product_data.model_dump())
     return product
 
 
@@ -95,12 +140,12 @@ async def create_product(
 async def update_product(
         product_id: UUID,
         product_data: ProductUpdate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = ProductRepository(db)
+    repo = AsyncProductRepository(db)
 
     # Проверяем существование продукта
-    existing_product = repo.get_by_id(str(product_id))
+    existing_product = await repo.get_by_id(str(product_id))
     if not existing_product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -109,25 +154,32 @@ async def update_product(
 
     # Проверяем уникальность артикула, если он изменяется
     if product_data.article is not None and product_data.article != existing_product.article:
-        product_with_article = repo.get_by_article(product_data.article)
+        product_with_article = await repo.get_by_article(product_data.article)
         if product_with_article:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Product with this article already exists"
             )
 
-    updated_product = repo.update(str(product_id), product_data.model_dump(exclude_unset=True))
+    # Остаток нельзя опустить ниже зарезервированного
+    try:
+        updated_product = await repo.update(str(product_id), product_data.model_dump(exclude_unset=True))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     return updated_product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_product(
         product_id: UUID,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    repo = ProductRepository(db)
+    repo = AsyncProductRepository(db)
 
-    success = repo.delete(str(product_id))
+    success = await repo.delete(str(product_id))
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -135,3 +187,35 @@ async def delete_product(
         )
 
     return None
+
+
+@router.post("/{product_id}/stock-buckets")
+async def split_product_stock(
+        product_id: UUID,
+        buckets: int = Query(settings.stock_reservation_buckets, ge=1, le=64),
+        current_user: dict = Depends(get_current_superuser),
+        db: AsyncSession = Depends(get_async_db)
+):
+    repo = AsyncStockReservationRepository(db)
+
+    # Остаток популярного продукта делится на строки, чтобы резервы не ждали одну строку
+    lent = await repo.split(str(product_id), buckets)
+    if lent is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+
+    return {"product_id": str(product_id), "buckets": buckets, "quantity": lent}
+
+
+@router.delete("/{product_id}/stock-buckets")
+async def merge_product_stock(
+        product_id: UUID,
+        current_user: dict = Depends(get_current_superuser),
+        db: AsyncSession = Depends(get_async_db)
+):
+    repo = AsyncStockReservationRepository(db)
+    merged = await repo.merge(str(product_id))
+
+    return {"product_id": str(product_id), "merged_buckets": merged}
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Query
+
+from app.repositories.suggest_index import suggest_index
+from app.schemas.search import SuggestResponse
+
+router = APIRouter()
+
+
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest(
+        q: str = Query(..., min_length=1, max_length=100),
+        limit: int = Query(10, ge=1, le=50)
+):
+    """Подсказки для строки поиска из индекса в памяти, без обращения к БД"""
+    return SuggestResponse(
+        query=q,
+        suggestions=suggest_index.suggest(q, limit)
+    )
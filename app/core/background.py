@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Периодическая фоновая задача в жизненном цикле приложения.
+    func - синхронная функция, возвращающая количество обработанных записей;
+    выполняется в отдельном потоке, чтобы не блокировать event loop.
+    wake() запускает следующий проход, не дожидаясь интервала
+    """
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], int]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.runs = 0
+        self.failures = 0
+        self.processed_total = 0
+        self.last_processed = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self.interval_seconds > 0 and self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop(), name=self.name)
+
+    def wake(self) -> None:
+        """Вызывается из event loop"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wake = None
+
+    async def run_once(self) -> int:
+        started = time.perf_counter()
+        try:
+            processed = await asyncio.to_thread(self.func)
+        except Exception:
+            self.failures += 1
+            logger.exception("Background task %s failed", self.name)
+            return 0
+        finally:
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        self.last_processed = processed
+        self.processed_total += processed
+        return processed
+
+    async def _loop(self) -> None:
+        while True:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "last_processed": self.last_processed,
+            "processed_total": self.processed_total
+        }
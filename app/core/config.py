@@ -1,12 +1,76 @@
+from typing import Literal, Optional
+
 from pydantic.v1 import BaseSettings
 
 
 class Settings(BaseSettings):
     app_name: str = "Lapcraft API"
     database_url: str = "sqlite:///./app.db"
+    # URL асинхронного движка; по умолчанию выводится из database_url (aiosqlite/asyncpg)
+    async_database_url: Optional[str] = None
     secret_key: str = "reverse 1999 peak gacha"
     refresh_secret_key = "blue archive +wibe gacha"
 
+    # Порог подсчета для total=estimate в списке продуктов
+    products_total_estimate_limit: int = 1000
+
+    # Кэш дерева категорий в памяти процесса; TTL (сек) ограничивает устаревание
+    # при записи из других процессов, 0 - без ограничения
+    category_cache_enabled: bool = True
+    category_cache_ttl_seconds: float = 60
+
+    # Пул потоков bcrypt: число одновременных вызовов и размер очереди ожидания.
+    # Запросы сверх очереди сразу получают 503
+    password_hash_workers: int = 4
+    password_hash_queue_size: int = 64
+
+    # Стоимость bcrypt подбирается при старте под целевое время хеширования (мс)
+    # в пределах [min, max]; bcrypt_rounds задает стоимость явно без калибровки
+    bcrypt_target_ms: float = 50
+    bcrypt_min_rounds: int = 10
+    bcrypt_max_rounds: int = 16
+    bcrypt_rounds: Optional[int] = None
+
+    # Stateless-аутентификация: пользователь берется из подписанных claims access token
+    # без запроса к users; версии токенов перечитываются из БД фоновой задачей раз в TTL (сек)
+    stateless_auth: bool = False
+    token_version_ttl_seconds: float = 30
+
+    # Размер LRU проверенных access token, 0 - кэш выключен
+    access_token_cache_size: int = 10000
+
+    # Фоновая очистка refresh token: истекшие и отозванные удаляются пачками
+    # по batch_size строк после retention_days; интервал 0 - очистка выключена
+    refresh_token_purge_interval_seconds: float = 3600
+    refresh_token_purge_batch_size: int = 1000
+    refresh_token_retention_days: float = 1
+    # Максимум действующих refresh token на пользователя, старые отзываются; 0 - без ограничения
+    refresh_tokens_per_user_limit: int = 10
+
+    # Отложенная запись users.last_login: раз в интервал (сек) или при накоплении flush_size
+    # записей; при переполнении буфера время входа пишется сразу. Интервал 0 - запись сразу
+    last_login_flush_interval_seconds: float = 5
+    last_login_flush_size: int = 500
+    last_login_buffer_max_size: int = 10000
+
+    # Хранилище корзин: "sql" - каждое изменение сразу в БД; "memory" - корзины в памяти процесса,
+    # изменения пишутся в БД пачкой раз в cart_flush_interval_seconds (> 0) и при остановке.
+    # При аварийном завершении в режиме "memory" теряются изменения за последний интервал;
+    # режим рассчитан на один процесс приложения (несколько воркеров разойдутся в данных)
+    cart_storage: Literal["sql", "memory"] = "sql"
+    cart_flush_interval_seconds: float = 1
+    cart_store_shards: int = 16
+    # Максимум корзин в памяти; сверх него вытесняются давно не использованные уже записанные
+    cart_store_max_users: int = 100000
+
+    # Резервирование остатков: резерв живет ttl секунд, просроченные снимаются фоновой задачей
+    # пачками по batch_size (интервал 0 - задача выключена); buckets - на сколько строк
+    # по умолчанию делится остаток популярного продукта
+    stock_reservation_ttl_seconds: float = 900
+    stock_reservation_expire_interval_seconds: float = 30
+    stock_reservation_expire_batch_size: int = 1000
+    stock_reservation_buckets: int = 8
+
     class Config:
         env_file = ".env"
 
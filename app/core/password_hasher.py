@@ -0,0 +1,126 @@
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, Tuple
+
+from app.core.config import settings
+from app.core.security import get_password_hash, verify_password, verify_and_update_password, get_bcrypt_rounds
+
+# Сколько последних вызовов учитывается в метриках задержки
+LATENCY_SAMPLES = 1000
+
+
+class PasswordHasherBusy(Exception):
+    """Все воркеры заняты и очередь ожидания заполнена"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hasher is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей bcrypt в отдельном пуле потоков.
+    bcrypt отпускает GIL, поэтому event loop продолжает обслуживать запросы.
+    Одновременно выполняется не более workers вызовов, еще queue_size ждут своей очереди,
+    остальные сразу отклоняются с PasswordHasherBusy
+    """
+
+    def __init__(self, workers: int, queue_size: int, retry_after: int = 1):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._run_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._submit(verify_and_update_password, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wait_ms = list(self._wait_ms)
+            run_ms = list(self._run_ms)
+            return {
+                "workers": self.workers,
+                "bcrypt_rounds": get_bcrypt_rounds(),
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "running": self._running,
+                "queued": self._in_flight - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_ms": _latency_summary(wait_ms),
+                "hash_ms": _latency_summary(run_ms)
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+
+    async def _submit(self, func: Callable, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise PasswordHasherBusy(self.retry_after)
+            self._in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hasher")
+            executor = self._executor
+
+        # Место освобождается, когда вызов завершен или снят из очереди,
+        # даже если ожидающий запрос уже отменен
+        future = executor.submit(self._run, func, args, time.perf_counter())
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _run(self, func: Callable, args: tuple, submitted: float):
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._wait_ms.append((started - submitted) * 1000)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_ms.append((time.perf_counter() - started) * 1000)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+
+def _latency_summary(samples: list) -> Dict[str, float]:
+    if not samples:
+        return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg": round(statistics.fmean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 2),
+        "max": round(ordered[-1], 2)
+    }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size
+)
@@ -1,15 +1,24 @@
 import hashlib
+import logging
+import math
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import secrets
 
 
 from app.core.config import settings
+from app.core.token_cache import VerifiedTokenCache
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Стоимость bcrypt, на которой замеряется скорость железа при калибровке
+BCRYPT_PROBE_ROUNDS = 8
+
 # Секретные ключи
 SECRET_KEY = settings.secret_key
 REFRESH_SECRET_KEY = settings.refresh_secret_key
@@ -17,30 +26,119 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 минут
 REFRESH_TOKEN_EXPIRE_DAYS = 30  # 30 дней
 
+token_cache = VerifiedTokenCache(max_size=settings.access_token_cache_size)
+
+
+def _prepare_password(password: str) -> str:
+    """bcrypt учитывает только первые 72 байта, длинные пароли предварительно сворачиваются в sha256"""
+    if len(password.encode("utf-8")) > 72:
+        return hashlib.sha256(password.encode("utf-8")).hexdigest()
+    return password
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверяет пароль"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return pwd_context.verify(_prepare_password(plain_password), hashed_password)
     except (ValueError, Exception):
         return False
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль и, если стоимость сохраненного хеша не совпадает с текущей,
+    возвращает новый хеш для сохранения (иначе None)
+    """
+    try:
+        return pwd_context.verify_and_update(_prepare_password(plain_password), hashed_password)
+    except (ValueError, Exception):
+        return False, None
+
+
 def get_password_hash(password: str) -> str:
     """Хеширует пароль"""
-    if len(password.encode("utf-8")) > 72:
-        password = hashlib.sha256(password.encode("utf-8")).hexdigest()
-
-    return pwd_context.hash(password)
+    return pwd_context.hash(_prepare_password(password))
+
+
+def get_bcrypt_rounds() -> int:
+    """Текущая стоимость bcrypt для новых хешей"""
+    return pwd_context.handler("bcrypt").default_rounds
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """
+    Подбирает стоимость bcrypt, при которой хеширование занимает около target_ms на этом железе.
+    Каждый раунд удваивает время, поэтому достаточно замерить одну дешевую стоимость
+    """
+    probe = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_PROBE_ROUNDS)
+    probe.hash("calibration")
+    samples = []
+    for _ in range(3):
+        started = time.perf_counter()
+        probe.hash("calibration")
+        samples.append((time.perf_counter() - started) * 1000)
+    probe_ms = sorted(samples)[1]
+
+    rounds = BCRYPT_PROBE_ROUNDS + round(math.log2(target_ms / max(probe_ms, 1e-3)))
+    return max(min_rounds, min(max_rounds, rounds))
+
+
+def configure_bcrypt_rounds(rounds: int) -> None:
+    """
+    Новые хеши создаются с этой стоимостью, а хеши с меньшей стоимостью считаются
+    устаревшими (needs_update) и перехешируются при входе. Более дорогие хеши не трогаются:
+    калибровка в разных процессах может дать разную стоимость, и иначе процессы
+    перехешировали бы пароли друг за другом при каждом входе
+    """
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds
+    )
+
+
+def setup_password_hashing() -> int:
+    """Настраивает стоимость bcrypt при старте: из настроек или калибровкой по целевому времени"""
+    if settings.bcrypt_rounds:
+        rounds = settings.bcrypt_rounds
+    else:
+        rounds = calibrate_bcrypt_rounds(
+            settings.bcrypt_target_ms,
+            settings.bcrypt_min_rounds,
+            settings.bcrypt_max_rounds
+        )
+    configure_bcrypt_rounds(rounds)
+    logger.info("bcrypt rounds: %s", rounds)
+    return rounds
+
+
+def user_token_data(user) -> Dict[str, Any]:
+    """Данные пользователя для access token"""
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "name": user.name,
+        "phone": user.phone,
+        "is_superuser": bool(user.is_superuser),
+        "token_version": user.token_version or 0
+    }
 
 
 def create_access_token(user: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
-    """Создает access token"""
+    """
+    Создает access token. Если переданы phone, is_superuser и token_version,
+    они попадают в claims и позволяют проверять токен без запроса к БД
+    """
     to_encode = {
         "sub": str(user["id"]),
         "email": user["email"],
         "name": user["name"]
     }
+    if "token_version" in user:
+        to_encode.update({
+            "phone": user.get("phone"),
+            "is_superuser": bool(user.get("is_superuser")),
+            "ver": user["token_version"]
+        })
 
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -58,7 +156,20 @@ def create_refresh_token() -> str:
 
 
 def verify_access_token(token: str) -> Optional[Dict[str, Any]]:
-    """Проверяет access token"""
+    """Проверяет access token; повторные проверки того же токена обслуживаются из кэша"""
+    if token_cache.max_size <= 0:
+        return _decode_access_token(token)
+
+    key = token_cache.key(token)
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = _decode_access_token(token)
+        if payload:
+            token_cache.put(key, payload)
+    return payload
+
+
+def _decode_access_token(token: str) -> Optional[Dict[str, Any]]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -1,9 +1,31 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """URL для асинхронного движка: sqlite -> aiosqlite, postgresql -> asyncpg"""
+    url = make_url(database_url)
+    if "+" in url.drivername:
+        backend, driver = url.drivername.split("+", 1)
+        if driver in ("aiosqlite", "asyncpg"):
+            return database_url
+    else:
+        backend = url.drivername
+    return url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername)).render_as_string(hide_password=False)
+
+
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
@@ -14,9 +36,20 @@ SessionLocal = sessionmaker(autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+async_engine = create_async_engine(settings.async_database_url or get_async_database_url(settings.database_url))
+
+# expire_on_commit=False: после commit объекты не перечитываются неявным (синхронным) запросом
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,120 @@
+from typing import Optional, List
+
+from sqlalchemy import text, column, table, literal_column, select, Select
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+# Полнотекстовый индекс продуктов (SQLite FTS5 с триграммным токенизатором).
+# Триграммы сохраняют семантику прежнего поиска ILIKE '%term%': совпадение по подстроке
+# без учета регистра, но поиск обслуживается индексом, а не полным сканированием
+PRODUCT_FTS_TABLE = "products_fts"
+PRODUCT_FTS_COLUMNS = ("title", "description")
+
+# Триграммный индекс не находит строки короче трех символов
+MIN_SEARCH_TERM_LENGTH = 3
+
+_product_fts_enabled = False
+
+products_fts = table(PRODUCT_FTS_TABLE, column("product_id"), *[column(name) for name in PRODUCT_FTS_COLUMNS])
+
+
+def setup_product_search(engine: Engine) -> bool:
+    """
+    Создает индекс при первом запуске и заполняет его существующими продуктами.
+    Возвращает False, если СУБД не поддерживает FTS5 - тогда используется ILIKE
+    """
+    global _product_fts_enabled
+
+    if engine.dialect.name != "sqlite":
+        _product_fts_enabled = False
+        return False
+
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": PRODUCT_FTS_TABLE}
+        ).first()
+
+        if not exists:
+            try:
+                connection.execute(text(
+                    f"CREATE VIRTUAL TABLE {PRODUCT_FTS_TABLE} "
+                    f"USING fts5(product_id UNINDEXED, {', '.join(PRODUCT_FTS_COLUMNS)}, tokenize = 'trigram')"
+                ))
+            except OperationalError:
+                _product_fts_enabled = False
+                return False
+            rebuild_product_search(connection)
+
+    _product_fts_enabled = True
+    return True
+
+
+def is_product_search_enabled() -> bool:
+    return _product_fts_enabled
+
+
+def rebuild_product_search(connection: Connection) -> int:
+    """Полностью перестраивает индекс по таблице products"""
+    connection.execute(text(f"DELETE FROM {PRODUCT_FTS_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {PRODUCT_FTS_TABLE} (product_id, title, description) "
+        f"SELECT id, title, COALESCE(description, '') FROM products"
+    ))
+    return connection.execute(text(f"SELECT COUNT(*) FROM {PRODUCT_FTS_TABLE}")).scalar()
+
+
+def index_product(db: Session, product_id: str, title: str, description: Optional[str]) -> None:
+    """Добавляет или обновляет продукт в индексе (в транзакции сессии)"""
+    if not _product_fts_enabled:
+        return
+    unindex_product(db, product_id)
+    db.execute(
+        text(f"INSERT INTO {PRODUCT_FTS_TABLE} (product_id, title, description) VALUES (:id, :title, :description)"),
+        {"id": product_id, "title": title, "description": description or ""}
+    )
+
+
+def unindex_product(db: Session, product_id: str) -> None:
+    """Удаляет продукт из индекса (в транзакции сессии)"""
+    if not _product_fts_enabled:
+        return
+    db.execute(text(f"DELETE FROM {PRODUCT_FTS_TABLE} WHERE product_id = :id"), {"id": product_id})
+
+
+def build_match_expression(search_term: str, fields: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Строит выражение MATCH для поиска подстроки в указанных полях.
+    None - индекс не может обслужить запрос (индекс выключен, короткая строка, неизвестные поля)
+    """
+    if not _product_fts_enabled:
+        return None
+
+    term = search_term.strip()
+    if len(term) < MIN_SEARCH_TERM_LENGTH:
+        return None
+
+    fields = list(fields) if fields else list(PRODUCT_FTS_COLUMNS)
+    if any(field not in PRODUCT_FTS_COLUMNS for field in fields):
+        return None
+
+    phrase = '"' + term.replace('"', '""') + '"'
+    return "{" + " ".join(fields) + "} : " + phrase
+
+
+def match_ids_query(match_expression: str) -> Select:
+    """Запрос ID продуктов, подходящих под выражение"""
+    return select(products_fts.c.product_id).where(_match_condition(match_expression))
+
+
+def match_query(match_expression: str) -> Select:
+    """Запрос ID продуктов, подходящих под выражение, с релевантностью (меньше - лучше)"""
+    return select(
+        products_fts.c.product_id,
+        literal_column(f"bm25({PRODUCT_FTS_TABLE})").label("rank")
+    ).where(_match_condition(match_expression))
+
+
+def _match_condition(match_expression: str):
+    return literal_column(PRODUCT_FTS_TABLE).op("MATCH")(match_expression)
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Callable
+
+from sqlalchemy import (
+    inspect, text, select, insert, Table, Column, Integer, String, DateTime, MetaData, Index
+)
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+from app.database.database import Base
+from app.models.cart import CartItem
+from app.models.favorite import Favorite
+from app.models.product import Product
+from app.models.refresh_token import RefreshToken
+from app.models.user import User
+
+# Примененные миграции; отдельные метаданные, чтобы таблица не смешивалась с моделями
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def add_missing_columns(engine: Engine) -> List[str]:
+    """
+    Добавляет в существующие таблицы колонки, объявленные в моделях, но отсутствующие в БД
+    (create_all создает только новые таблицы). Новые NOT NULL колонки должны иметь server_default
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    Применяет непримененные миграции по порядку версий, каждую в своей транзакции.
+    Индексы объявлены и в моделях: в новой БД их создает create_all, миграция их пропускает
+    """
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+    migrated = []
+    for migration in sorted(MIGRATIONS, key=lambda item: item.version):
+        if migration.version in applied:
+            continue
+        try:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(insert(schema_migrations).values(
+                    version=migration.version,
+                    name=migration.name,
+                    applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Миграцию одновременно применил другой процесс - тогда она уже записана;
+            # иначе это ошибка самой миграции (например, уникальный индекс на дублях)
+            with engine.connect() as connection:
+                recorded = connection.execute(
+                    select(schema_migrations.c.version).where(schema_migrations.c.version == migration.version)
+                ).first()
+            if recorded is None:
+                raise
+            continue
+        migrated.append(migration.version)
+    return migrated
+
+
+def _index(table: Table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+
+def _deduplicate_favorites(connection: Connection) -> None:
+    """Оставляет по одной записи избранного на пару (user_id, product_id)"""
+    connection.execute(text(
+        "DELETE FROM favorites WHERE id NOT IN "
+        "(SELECT MIN(id) FROM favorites GROUP BY user_id, product_id)"
+    ))
+
+
+def _deduplicate_cart_items(connection: Connection) -> None:
+    """Сливает повторные позиции корзины в одну, складывая количество"""
+    connection.execute(text(
+        "UPDATE cart_items SET quantity = ("
+        "SELECT SUM(duplicate.quantity) FROM cart_items AS duplicate "
+        "WHERE duplicate.user_id = cart_items.user_id AND duplicate.product_id = cart_items.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    connection.execute(text(
+        "DELETE FROM cart_items WHERE id NOT IN "
+        "(SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id)"
+    ))
+
+
+# Индексы, которые создает каждая миграция
+MIGRATION_INDEXES = {
+    1: [
+        _index(User.__table__, "ix_users_email"),
+        _index(Favorite.__table__, "uq_favorites_user_product"),
+        _index(CartItem.__table__, "uq_cart_items_user_product"),
+        _index(Product.__table__, "ix_products_category_price"),
+        _index(Product.__table__, "ix_products_price_id"),
+        _index(Product.__table__, "ix_products_title_id"),
+        _index(RefreshToken.__table__, "ix_refresh_tokens_expires_at"),
+    ],
+    2: [
+        _index(Favorite.__table__, "ix_favorites_user_created_id"),
+    ],
+}
+
+
+def _hot_path_indexes(connection: Connection) -> None:
+    _deduplicate_favorites(connection)
+    _deduplicate_cart_items(connection)
+    for index in MIGRATION_INDEXES[1]:
+        index.create(connection, checkfirst=True)
+
+
+def _favorites_keyset_index(connection: Connection) -> None:
+    for index in MIGRATION_INDEXES[2]:
+        index.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, "hot path indexes", _hot_path_indexes),
+    Migration(2, "favorites keyset index", _favorites_keyset_index),
+]
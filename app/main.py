@@ -1,15 +1,124 @@
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
 from fastapi import FastAPI
 
 from app.api.v1.api import api_router
+from app.core.background import PeriodicTask
 from app.core.config import settings
-from app.database.database import Base, engine
+from app.core.password_hasher import password_hasher
+from app.core.security import setup_password_hashing, token_cache
+from app.database.database import Base, engine, SessionLocal
+from app.database.fts import setup_product_search
+from app.database.migrations import add_missing_columns, run_migrations
+from app.repositories.cart_store import cart_store
+from app.repositories.last_login_buffer import last_login_buffer
+from app.repositories.refresh_token_repository import RefreshTokenRepository
+from app.repositories.stock_reservation_repository import StockReservationRepository
+from app.repositories.suggest_index import suggest_index
+from app.repositories.token_versions import token_versions
 
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+run_migrations(engine)
+setup_product_search(engine)
+
+
+def purge_refresh_tokens() -> int:
+    db = SessionLocal()
+    try:
+        return RefreshTokenRepository(db).purge(
+            retention=timedelta(days=settings.refresh_token_retention_days),
+            batch_size=settings.refresh_token_purge_batch_size
+        )
+    finally:
+        db.close()
+
+
+refresh_token_purge = PeriodicTask(
+    "refresh_token_purge",
+    settings.refresh_token_purge_interval_seconds,
+    purge_refresh_tokens
+)
+
+
+def expire_stock_reservations() -> int:
+    db = SessionLocal()
+    try:
+        return StockReservationRepository(db).expire(settings.stock_reservation_expire_batch_size)
+    finally:
+        db.close()
+
+
+stock_reservation_expiry = PeriodicTask(
+    "stock_reservation_expiry",
+    settings.stock_reservation_expire_interval_seconds,
+    expire_stock_reservations
+)
+
+
+def refresh_token_versions() -> int:
+    db = SessionLocal()
+    try:
+        return token_versions.load(db)
+    finally:
+        db.close()
 
-app = FastAPI(title=settings.app_name)
+
+token_version_refresh = PeriodicTask(
+    "token_version_refresh",
+    settings.token_version_ttl_seconds,
+    refresh_token_versions
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Стоимость bcrypt подбирается под производительность железа
+    setup_password_hashing()
+
+    # Индекс подсказок поиска загружается в память при старте
+    db = SessionLocal()
+    try:
+        suggest_index.load(db)
+    finally:
+        db.close()
+
+    refresh_token_purge.start()
+    stock_reservation_expiry.start()
+    last_login_buffer.start()
+    if settings.stateless_auth:
+        token_version_refresh.start()
+    if settings.cart_storage == "memory":
+        cart_store.start()
+
+    yield
+
+    await refresh_token_purge.stop()
+    await stock_reservation_expiry.stop()
+    await last_login_buffer.stop()
+    await token_version_refresh.stop()
+    await cart_store.stop()
+    password_hasher.shutdown()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/api/metrics")
+def metrics():
+    return {
+        "password_hasher": password_hasher.stats(),
+        "access_token_cache": token_cache.stats(),
+        "refresh_token_purge": refresh_token_purge.stats(),
+        "stock_reservation_expiry": stock_reservation_expiry.stats(),
+        "last_login_buffer": last_login_buffer.stats(),
+        "token_version_refresh": token_version_refresh.stats(),
+        "cart_store": cart_store.stats()
+    }
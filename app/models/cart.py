@@ -1,10 +1,13 @@
-from sqlalchemy import Column, String, ForeignKey, Integer, DateTime, func
+from sqlalchemy import Column, String, ForeignKey, Integer, DateTime, Index, func
 
 from app.database.base_class import BaseModel
 
 
 class CartItem(BaseModel):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        Index("uq_cart_items_user_product", "user_id", "product_id", unique=True),
+    )
 
     user_id = Column(String, ForeignKey('users.id'), nullable=False, index=True)
     product_id = Column(String, ForeignKey('products.id'), nullable=False, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, func
+from sqlalchemy import Column, String, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import relationship
 
 from app.database.base_class import BaseModel
@@ -6,6 +6,11 @@ from app.database.base_class import BaseModel
 
 class Favorite(BaseModel):
     __tablename__ = "favorites"
+    __table_args__ = (
+        Index("uq_favorites_user_product", "user_id", "product_id", unique=True),
+        # Курсорная пагинация избранного пользователя по (created_at, id)
+        Index("ix_favorites_user_created_id", "user_id", "created_at", "id"),
+    )
 
     user_id = Column(String, ForeignKey('users.id'), nullable=False, index=True)
     product_id = Column(String, ForeignKey('products.id'), nullable=False, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, JSON, ForeignKey, Index
 
 from sqlalchemy.orm import relationship
 from app.database.base_class import BaseModel
@@ -6,6 +6,12 @@ from app.database.base_class import BaseModel
 
 class Product(BaseModel):
     __tablename__ = "products"
+    __table_args__ = (
+        # Фильтр по категории с сортировкой/диапазоном цены и сортировки списка (id - для курсора)
+        Index("ix_products_category_price", "category_id", "price"),
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_title_id", "title", "id"),
+    )
 
     article = Column(Integer, unique=True, index=True, nullable=True)
     title = Column(String, nullable=False)
@@ -14,6 +20,8 @@ class Product(BaseModel):
     category_id = Column(String, ForeignKey('categories.id'), nullable=True, index=True)
     image_urls = Column(JSON, default=list)
     stock_quantity = Column(Integer, default=0)
+    # Зарезервировано (stock_reservation_repository); доступно stock_quantity - reserved_quantity
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Связь с категорией
     category = relationship("Category", back_populates="products")
@@ -9,8 +9,9 @@ class RefreshToken(BaseModel):
 
     user_id = Column(String, ForeignKey('users.id'), nullable=False, index=True)
     token = Column(String, unique=True, nullable=False, index=True)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     is_revoked = Column(Boolean, default=False)
+    revoked_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
     def __repr__(self):
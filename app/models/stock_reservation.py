@@ -0,0 +1,45 @@
+from sqlalchemy import Column, String, ForeignKey, Integer, DateTime, Index, CheckConstraint, func
+
+from app.database.base_class import BaseModel
+
+
+class StockBucket(BaseModel):
+    """
+    Часть остатка популярного продукта, выделенная из строки products,
+    чтобы резервирования расходились по нескольким строкам.
+    Доступно capacity - reserved - sold
+    """
+    __tablename__ = "stock_buckets"
+    __table_args__ = (
+        Index("uq_stock_buckets_product_bucket", "product_id", "bucket", unique=True),
+    )
+
+    product_id = Column(String, ForeignKey('products.id'), nullable=False)
+    bucket = Column(Integer, nullable=False)
+    capacity = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+    sold = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<StockBucket product_id={self.product_id} bucket={self.bucket} capacity={self.capacity}>"
+
+
+class StockReservation(BaseModel):
+    """
+    Резерв товара пользователем до expires_at. bucket_id - строка stock_buckets, из которой взят резерв
+    (None - из строки products); после слияния корзин резерв снимается со строки продукта
+    """
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        CheckConstraint("quantity > 0", name="ck_stock_reservations_quantity_positive"),
+    )
+
+    product_id = Column(String, ForeignKey('products.id'), nullable=False, index=True)
+    user_id = Column(String, ForeignKey('users.id'), nullable=False, index=True)
+    bucket_id = Column(String(36), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<StockReservation product_id={self.product_id} quantity={self.quantity}>"
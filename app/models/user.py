@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, func
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, func
 
 from app.database.base_class import BaseModel
 
@@ -7,11 +7,13 @@ class User(BaseModel):
     __tablename__ = "users"
 
     name = Column(String, nullable=False)
-    email = Column(String, nullable=False)
+    email = Column(String, nullable=False, index=True)
     phone = Column(String)
     hashed_password = Column(String)
     is_superuser = Column(Boolean, default=False)
     last_login = Column(DateTime, nullable=True)
+    # Увеличивается при выходе со всех устройств: выданные ранее access token становятся недействительны
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, server_default=func.now())
 
     def __repr__(self):
@@ -0,0 +1,65 @@
+from typing import Any, Callable, Type
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.repositories.cart_store import CART_REPOSITORIES
+from app.repositories.category_repository import CategoryRepository
+from app.repositories.favorite_repository import FavoriteRepository
+from app.repositories.product_repository import ProductRepository
+from app.repositories.refresh_token_repository import RefreshTokenRepository
+from app.repositories.stock_reservation_repository import StockReservationRepository
+from app.repositories.user_repository import UserRepository
+
+
+class AsyncRepository:
+    """
+    Асинхронный вариант репозитория. Каждый метод синхронного репозитория выполняется
+    через AsyncSession.run_sync: логика запросов общая, а каждое обращение к БД
+    ожидается асинхронным драйвером и не блокирует event loop.
+    Возвращаемые ORM-объекты уже загружены: ленивые связи вне метода репозитория недоступны
+    """
+    repository_class: Type = None
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = getattr(self.repository_class, name)
+
+        async def call(*args, **kwargs):
+            return await self.db.run_sync(
+                lambda session: method(self.repository_class(session), *args, **kwargs)
+            )
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+
+class AsyncProductRepository(AsyncRepository):
+    repository_class = ProductRepository
+
+
+class AsyncCategoryRepository(AsyncRepository):
+    repository_class = CategoryRepository
+
+
+class AsyncUserRepository(AsyncRepository):
+    repository_class = UserRepository
+
+
+class AsyncRefreshTokenRepository(AsyncRepository):
+    repository_class = RefreshTokenRepository
+
+
+class AsyncFavoriteRepository(AsyncRepository):
+    repository_class = FavoriteRepository
+
+
+class AsyncCartRepository(AsyncRepository):
+    repository_class = CART_REPOSITORIES[settings.cart_storage]
+
+
+class AsyncStockReservationRepository(AsyncRepository):
+    repository_class = StockReservationRepository
@@ -1,9 +1,63 @@
-from typing import List, Optional, Dict, Any
+import uuid
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func, select, update, delete, insert, literal, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.models.cart import CartItem
 from app.models.product import Product
+from app.repositories.stock_reservation_repository import available_quantity
+
+
+# Диалекты с INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def operation_product_ids(operations: List[Dict[str, Any]]) -> List[str]:
+    """ID продуктов из пакета операций без повторов, в порядке появления"""
+    return list(dict.fromkeys(operation["product_id"] for operation in operations))
+
+
+def plan_operations(
+        operations: List[Dict[str, Any]],
+        stock: Dict[str, int],
+        current: Dict[str, int]
+) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Итог пакета операций над корзиной: продукты для удаления и новые количества.
+    stock - доступные остатки продуктов, current - текущие количества в корзине.
+    ValueError, если продукта нет или остатка не хватает
+    """
+    product_ids = operation_product_ids(operations)
+    missing = [product_id for product_id in product_ids if product_id not in stock]
+    if missing:
+        raise ValueError(f"Products not found: {', '.join(missing)}")
+
+    quantities = dict(current)
+    for operation in operations:
+        product_id = operation["product_id"]
+        if operation.get("quantity") is not None:
+            quantities[product_id] = operation["quantity"]
+        else:
+            quantities[product_id] = quantities.get(product_id, 0) + operation["delta"]
+
+    removed = [
+        product_id for product_id in product_ids
+        if quantities[product_id] <= 0 and product_id in current
+    ]
+    changed = {
+        product_id: quantities[product_id] for product_id in product_ids
+        if quantities[product_id] > 0 and quantities[product_id] != current.get(product_id)
+    }
+
+    short = [product_id for product_id, quantity in changed.items() if quantity > stock[product_id]]
+    if short:
+        raise ValueError(f"Not enough stock available for products: {', '.join(short)}")
+
+    return removed, changed
 
 
 class CartRepository:
@@ -42,26 +96,127 @@ class CartRepository:
 
         return cart_items
 
-    def add_to_cart(self, user_id: str, product_id: str, quantity: int = 1) -> CartItem:
+    def get_cart(self, user_id: str, include_items: bool = True) -> Dict[str, Any]:
+        """
+        Корзина одним запросом: позиции с продуктами, сумма и количество позиций.
+        Сумма и количество считаются оконными функциями в той же выборке;
+        include_items=False - только агрегаты без строк позиций
+        """
+        line_total = CartItem.quantity * Product.price
+
+        if not include_items:
+            total, items_count = self.db.query(
+                func.coalesce(func.sum(line_total), 0.0),
+                func.count(CartItem.id)
+            ).join(
+                Product, CartItem.product_id == Product.id
+            ).filter(
+                CartItem.user_id == user_id
+            ).one()
+            return {"items": [], "total": float(total), "items_count": items_count}
+
+        rows = self.db.query(
+            CartItem.quantity,
+            Product.id,
+            Product.title,
+            Product.description,
+            Product.price,
+            Product.image_urls,
+            func.sum(line_total).over().label("cart_total"),
+            func.count().over().label("cart_count")
+        ).join(
+            Product, CartItem.product_id == Product.id
+        ).filter(
+            CartItem.user_id == user_id
+        ).order_by(CartItem.created_at, CartItem.id).all()
+
+        items = [
+            {
+                "product_id": row.id,
+                "image_url": row.image_urls[0] if row.image_urls else None,
+                "title": row.title,
+                "description": row.description,
+                "price": row.price,
+                "count": row.quantity
+            }
+            for row in rows
+        ]
+        return {
+            "items": items,
+            "total": float(rows[0].cart_total) if rows else 0.0,
+            "items_count": rows[0].cart_count if rows else 0
+        }
+
+    def add_item(self, user_id: str, product_id: str, quantity: int = 1) -> Optional[str]:
+        """
+        Добавляет товар в корзину одним INSERT ... SELECT ... ON CONFLICT DO UPDATE:
+        строка вставляется или количество увеличивается, только если итоговое количество
+        не превышает доступный остаток продукта (за вычетом резервов). Возвращает ID позиции корзины или None,
+        если продукта нет или остатка не хватает
+        """
+        dialect = self.db.get_bind().dialect.name
+        if dialect not in UPSERT_DIALECTS:
+            return self._add_item_with_lock(user_id, product_id, quantity)
+
+        stock = select(available_quantity).where(Product.id == product_id).scalar_subquery()
+        statement = UPSERT_DIALECTS[dialect](CartItem).from_select(
+            ["id", "user_id", "product_id", "quantity"],
+            select(
+                literal(str(uuid.uuid4())),
+                literal(user_id),
+                Product.id,
+                literal(quantity)
+            ).where(Product.id == product_id, available_quantity >= quantity)
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={
+                "quantity": CartItem.quantity + statement.excluded.quantity,
+                "updated_at": func.now()
+            },
+            where=CartItem.quantity + statement.excluded.quantity <= stock
+        ).returning(CartItem.id)
+
+        cart_item_id = self.db.execute(statement).scalar()
+        self.db.commit()
+        return cart_item_id
+
+    def _add_item_with_lock(self, user_id: str, product_id: str, quantity: int) -> Optional[str]:
+        """add_item для СУБД без ON CONFLICT: строка продукта блокируется на время проверки"""
+        product = self.db.query(Product).filter(Product.id == product_id).with_for_update().first()
+        available = self.db.execute(select(available_quantity).where(Product.id == product_id)).scalar()
         cart_item = self.get_by_user_and_product(user_id, product_id)
+        new_quantity = quantity + (cart_item.quantity if cart_item else 0)
+        if not product or available < new_quantity:
+            self.db.rollback()
+            return None
 
         if cart_item:
-            cart_item.quantity += quantity
+            cart_item.quantity = new_quantity
         else:
             cart_item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
             self.db.add(cart_item)
-
         self.db.commit()
-        self.db.refresh(cart_item)
-        return cart_item
+        return cart_item.id
 
-    def update_cart_item_quantity(self, user_id: str, product_id: str, quantity: int) -> Optional[CartItem]:
-        cart_item = self.get_by_user_and_product(user_id, product_id)
-        if cart_item:
-            cart_item.quantity = quantity
-            self.db.commit()
-            self.db.refresh(cart_item)
-        return cart_item
+    def set_item_quantity(self, user_id: str, product_id: str, quantity: int) -> bool:
+        """
+        Устанавливает количество товара условным UPDATE: строка меняется,
+        только если товар есть в корзине и доступного остатка продукта хватает
+        """
+        stock = select(available_quantity).where(Product.id == product_id).scalar_subquery()
+        result = self.db.execute(
+            update(CartItem)
+            .where(
+                CartItem.user_id == user_id,
+                CartItem.product_id == product_id,
+                literal(quantity) <= stock
+            )
+            .values(quantity=quantity)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount > 0
 
     def remove_from_cart(self, user_id: str, product_id: str) -> bool:
         cart_item = self.get_by_user_and_product(user_id, product_id)
@@ -72,28 +227,105 @@ class CartRepository:
         return False
 
     def clear_cart(self, user_id: str) -> bool:
-        cart_items = self.get_user_cart_items(user_id)
-        for item in cart_items:
-            self.db.delete(item)
+        self.db.execute(
+            delete(CartItem)
+            .where(CartItem.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
         self.db.commit()
         return True
 
-    def get_cart_total(self, user_id: str) -> float:
-        """Получает общую стоимость корзины"""
-        results = self.db.query(
-            CartItem.quantity,
-            Product.price
-        ).join(
-            Product, CartItem.product_id == Product.id
+    def apply_operations(self, user_id: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Применяет пакет изменений корзины в одной транзакции и возвращает новую корзину.
+        Операция: product_id и quantity (новое количество, 0 - удалить) или delta (изменение).
+        Доступные остатки и текущие количества читаются одним запросом с IN, изменения пишутся
+        пакетными DELETE и upsert. Запись тоже условна (количество не больше остатка), поэтому
+        изменение остатка между чтением и записью не приводит к превышению: такие позиции
+        обнаруживаются проверочным чтением. Если хотя бы одна операция невыполнима - ValueError,
+        корзина не меняется
+        """
+        product_ids = operation_product_ids(operations)
+        rows = self.db.query(
+            Product.id,
+            available_quantity.label("available_quantity"),
+            CartItem.quantity
+        ).outerjoin(
+            CartItem, and_(CartItem.product_id == Product.id, CartItem.user_id == user_id)
         ).filter(
-            CartItem.user_id == user_id
+            Product.id.in_(product_ids)
         ).all()
 
-        total = 0.0
-        for quantity, price in results:
-            total += quantity * price
+        stock = {row.id: row.available_quantity for row in rows}
+        current = {row.id: row.quantity for row in rows if row.quantity is not None}
+        removed, changed = plan_operations(operations, stock, current)
+
+        if removed:
+            self.db.execute(
+                delete(CartItem)
+                .where(CartItem.user_id == user_id, CartItem.product_id.in_(removed))
+                .execution_options(synchronize_session=False)
+            )
+        if changed:
+            self._write_quantities(user_id, changed, current)
+            written = dict(self.db.query(CartItem.product_id, CartItem.quantity).filter(
+                CartItem.user_id == user_id,
+                CartItem.product_id.in_(list(changed))
+            ).all())
+            short = [product_id for product_id, quantity in changed.items() if written.get(product_id) != quantity]
+            if short:
+                self.db.rollback()
+                raise ValueError(f"Not enough stock available for products: {', '.join(short)}")
+        self.db.commit()
+
+        return self.get_cart(user_id)
+
+    def _write_quantities(self, user_id: str, quantities: Dict[str, int], current: Dict[str, int]) -> None:
+        """
+        Записывает итоговые количества: один executemany upsert (или UPDATE + INSERT без ON CONFLICT).
+        Строка пишется, только если количество не больше доступного остатка продукта на момент записи
+        """
+        stock = select(available_quantity).where(Product.id == bindparam("item_product_id")).scalar_subquery()
+        new_item = select(
+            bindparam("item_id"),
+            literal(user_id),
+            Product.id,
+            bindparam("item_quantity")
+        ).where(Product.id == bindparam("item_product_id"), available_quantity >= bindparam("item_quantity"))
+        items = [
+            {"item_id": str(uuid.uuid4()), "item_product_id": product_id, "item_quantity": quantity}
+            for product_id, quantity in quantities.items()
+        ]
+
+        # executemany с INSERT ... SELECT идет через Core-таблицу, ORM bulk insert его не поддерживает
+        cart_items = CartItem.__table__
+        columns = ["id", "user_id", "product_id", "quantity"]
+        dialect = self.db.get_bind().dialect.name
+        if dialect in UPSERT_DIALECTS:
+            statement = UPSERT_DIALECTS[dialect](cart_items).from_select(columns, new_item)
+            statement = statement.on_conflict_do_update(
+                index_elements=[cart_items.c.user_id, cart_items.c.product_id],
+                set_={"quantity": statement.excluded.quantity, "updated_at": func.now()},
+                where=statement.excluded.quantity <= stock
+            )
+            self.db.execute(statement, items)
+            return
 
-        return total
+        existing = [item for item in items if item["item_product_id"] in current]
+        if existing:
+            self.db.execute(
+                update(cart_items)
+                .where(
+                    cart_items.c.user_id == user_id,
+                    cart_items.c.product_id == bindparam("item_product_id"),
+                    bindparam("item_quantity") <= stock
+                )
+                .values(quantity=bindparam("item_quantity")),
+                existing
+            )
+        new = [item for item in items if item["item_product_id"] not in current]
+        if new:
+            self.db.execute(insert(cart_items).from_select(columns, new_item), new)
 
     def get_cart_items_count(self, user_id: str) -> int:
         """Получает общее количество товаров в корзине"""
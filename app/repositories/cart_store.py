@@ -0,0 +1,351 @@
+import asyncio
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.orm import Session
+
+from app.core.background import PeriodicTask
+from app.core.config import settings
+from app.database.database import SessionLocal
+from app.models.cart import CartItem
+from app.models.product import Product
+from app.repositories.cart_repository import CartRepository, operation_product_ids, plan_operations
+from app.repositories.stock_reservation_repository import available_quantity
+
+T = TypeVar("T")
+
+# Размер пачки ID в IN при записи
+FLUSH_CHUNK_SIZE = 500
+
+
+class CartLine(NamedTuple):
+    id: str
+    quantity: int
+    created_at: datetime
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.carts: "OrderedDict[str, Dict[str, CartLine]]" = OrderedDict()
+        self.dirty: Set[str] = set()
+        self.flushing: Set[str] = set()
+
+
+def _chunks(values: List[str], size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class CartStore:
+    """
+    Корзины в памяти процесса: user_id -> {product_id: CartLine}.
+    Пользователи распределены по шардам, у каждого шарда своя блокировка.
+    Корзина загружается из cart_items при первом обращении, измененные корзины
+    записываются в БД целиком раз в flush_interval секунд и при остановке.
+    Сверх max_users вытесняются давно не использованные корзины, уже записанные в БД
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], flush_interval: float,
+                 shards: int, max_users: int):
+        self.session_factory = session_factory
+        self.max_users = max_users
+        self.task = PeriodicTask("cart_flush", flush_interval, self.flush)
+        self._shards = [_Shard() for _ in range(max(shards, 1))]
+        self._shard_max_users = max(max_users // len(self._shards), 1)
+        self.loads = 0
+        self.evictions = 0
+
+    def _shard(self, user_id: str) -> _Shard:
+        return self._shards[zlib.crc32(user_id.encode("utf-8")) % len(self._shards)]
+
+    @staticmethod
+    def _load(db: Session, user_id: str) -> Dict[str, CartLine]:
+        rows = db.query(
+            CartItem.product_id,
+            CartItem.id,
+            CartItem.quantity,
+            CartItem.created_at
+        ).filter(CartItem.user_id == user_id).all()
+        return {row.product_id: CartLine(row.id, row.quantity, row.created_at) for row in rows}
+
+    def update(self, db: Session, user_id: str,
+               mutate: Callable[[Dict[str, CartLine]], Tuple[T, bool]]) -> T:
+        """
+        Выполняет mutate над корзиной под блокировкой шарда.
+        mutate возвращает (результат, изменена ли корзина); исключение оставляет корзину как есть,
+        поэтому mutate должен проверить все условия до изменения
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            lines = shard.carts.get(user_id)
+            if lines is not None:
+                return self._apply(shard, user_id, lines, mutate)
+
+        # Загрузка из БД вне блокировки, чтобы не задерживать остальных пользователей шарда
+        loaded = self._load(db, user_id)
+        with shard.lock:
+            if user_id not in shard.carts:
+                shard.carts[user_id] = loaded
+                self.loads += 1
+            result = self._apply(shard, user_id, shard.carts[user_id], mutate)
+            self._evict(shard, keep=user_id)
+            return result
+
+    @staticmethod
+    def _apply(shard: _Shard, user_id: str, lines: Dict[str, CartLine],
+               mutate: Callable[[Dict[str, CartLine]], Tuple[T, bool]]) -> T:
+        shard.carts.move_to_end(user_id)
+        result, changed = mutate(lines)
+        if changed:
+            shard.dirty.add(user_id)
+        return result
+
+    def read(self, db: Session, user_id: str) -> Dict[str, CartLine]:
+        """Копия корзины пользователя"""
+        return self.update(db, user_id, lambda lines: (dict(lines), False))
+
+    def _evict(self, shard: _Shard, keep: str) -> None:
+        """Вызывается под блокировкой шарда; корзина keep не вытесняется"""
+        excess = len(shard.carts) - self._shard_max_users
+        if excess <= 0:
+            return
+        victims = []
+        for user_id in shard.carts:
+            if user_id != keep and user_id not in shard.dirty and user_id not in shard.flushing:
+                victims.append(user_id)
+                if len(victims) >= excess:
+                    break
+        for user_id in victims:
+            del shard.carts[user_id]
+        self.evictions += len(victims)
+
+    def flush(self) -> int:
+        """
+        Записывает измененные корзины одной транзакцией: DELETE их позиций и пакетный INSERT.
+        Позиции удаленных продуктов не записываются. При ошибке корзины снова помечаются измененными
+        """
+        snapshot: Dict[str, Dict[str, CartLine]] = {}
+        for shard in self._shards:
+            with shard.lock:
+                for user_id in shard.dirty:
+                    snapshot[user_id] = dict(shard.carts[user_id])
+                shard.flushing |= shard.dirty
+                shard.dirty = set()
+        if not snapshot:
+            return 0
+
+        db = self.session_factory()
+        try:
+            product_ids = list({product_id for lines in snapshot.values() for product_id in lines})
+            existing = set()
+            for chunk in _chunks(product_ids, FLUSH_CHUNK_SIZE):
+                existing.update(db.scalars(select(Product.id).where(Product.id.in_(chunk))))
+
+            for chunk in _chunks(list(snapshot), FLUSH_CHUNK_SIZE):
+                db.execute(
+                    delete(CartItem)
+                    .where(CartItem.user_id.in_(chunk))
+                    .execution_options(synchronize_session=False)
+                )
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "id": line.id,
+                    "user_id": user_id,
+                    "product_id": product_id,
+                    "quantity": line.quantity,
+                    "created_at": line.created_at,
+                    "updated_at": now
+                }
+                for user_id, lines in snapshot.items()
+                for product_id, line in lines.items() if product_id in existing
+            ]
+            if rows:
+                db.execute(insert(CartItem), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for user_id in snapshot:
+                shard = self._shard(user_id)
+                with shard.lock:
+                    shard.dirty.add(user_id)
+            raise
+        finally:
+            db.close()
+            for user_id in snapshot:
+                shard = self._shard(user_id)
+                with shard.lock:
+                    shard.flushing.discard(user_id)
+        return len(snapshot)
+
+    def start(self) -> None:
+        self.task.start()
+
+    async def stop(self) -> None:
+        """Останавливает фоновую запись и записывает оставшиеся изменения"""
+        await self.task.stop()
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        carts = dirty = 0
+        for shard in self._shards:
+            with shard.lock:
+                carts += len(shard.carts)
+                dirty += len(shard.dirty)
+        return {
+            **self.task.stats(),
+            "shards": len(self._shards),
+            "carts": carts,
+            "dirty": dirty,
+            "max_users": self.max_users,
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
+
+
+cart_store = CartStore(
+    SessionLocal,
+    flush_interval=settings.cart_flush_interval_seconds,
+    shards=settings.cart_store_shards,
+    max_users=settings.cart_store_max_users
+)
+
+
+class MemoryCartRepository(CartRepository):
+    """
+    Корзина из CartStore: позиции читаются и меняются в памяти, из БД читаются
+    только продукты (цены и доступные остатки) одним запросом по первичному ключу.
+    В cart_items изменения попадают при фоновой записи хранилища
+    """
+
+    def __init__(self, db: Session, store: Optional[CartStore] = None):
+        super().__init__(db)
+        self.store = store or cart_store
+
+    def _stock(self, product_ids: List[str]) -> Dict[str, int]:
+        """Доступные остатки продуктов (за вычетом резервов)"""
+        rows = self.db.query(
+            Product.id,
+            available_quantity.label("available_quantity")
+        ).filter(Product.id.in_(product_ids)).all()
+        return {row.id: row.available_quantity for row in rows}
+
+    def get_cart(self, user_id: str, include_items: bool = True) -> Dict[str, Any]:
+        lines = sorted(
+            self.store.read(self.db, user_id).items(),
+            key=lambda item: (item[1].created_at or datetime.min, item[1].id)
+        )
+        if not lines:
+            return {"items": [], "total": 0.0, "items_count": 0}
+
+        columns = [Product.id, Product.price]
+        if include_items:
+            columns += [Product.title, Product.description, Product.image_urls]
+        products = {
+            row.id: row
+            for row in self.db.query(*columns).filter(Product.id.in_([product_id for product_id, _ in lines]))
+        }
+
+        items = []
+        total = 0.0
+        for product_id, line in lines:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            total += line.quantity * product.price
+            items.append({
+                "product_id": product_id,
+                "image_url": product.image_urls[0] if include_items and product.image_urls else None,
+                "title": product.title if include_items else None,
+                "description": product.description if include_items else None,
+                "price": product.price,
+                "count": line.quantity
+            })
+        return {"items": items if include_items else [], "total": float(total), "items_count": len(items)}
+
+    def get_user_cart_with_products(self, user_id: str) -> List[Dict[str, Any]]:
+        return self.get_cart(user_id)["items"]
+
+    def add_item(self, user_id: str, product_id: str, quantity: int = 1) -> Optional[str]:
+        stock = self._stock([product_id]).get(product_id)
+        if stock is None:
+            return None
+
+        def mutate(lines: Dict[str, CartLine]) -> Tuple[Optional[str], bool]:
+            line = lines.get(product_id)
+            new_quantity = quantity + (line.quantity if line else 0)
+            if new_quantity > stock:
+                return None, False
+            if line:
+                line = line._replace(quantity=new_quantity)
+            else:
+                line = CartLine(str(uuid.uuid4()), quantity, datetime.utcnow())
+            lines[product_id] = line
+            return line.id, True
+
+        return self.store.update(self.db, user_id, mutate)
+
+    def set_item_quantity(self, user_id: str, product_id: str, quantity: int) -> bool:
+        stock = self._stock([product_id]).get(product_id)
+        if stock is None:
+            return False
+
+        def mutate(lines: Dict[str, CartLine]) -> Tuple[bool, bool]:
+            line = lines.get(product_id)
+            if line is None or quantity > stock:
+                return False, False
+            lines[product_id] = line._replace(quantity=quantity)
+            return True, True
+
+        return self.store.update(self.db, user_id, mutate)
+
+    def remove_from_cart(self, user_id: str, product_id: str) -> bool:
+        def mutate(lines: Dict[str, CartLine]) -> Tuple[bool, bool]:
+            removed = lines.pop(product_id, None) is not None
+            return removed, removed
+
+        return self.store.update(self.db, user_id, mutate)
+
+    def clear_cart(self, user_id: str) -> bool:
+        def mutate(lines: Dict[str, CartLine]) -> Tuple[bool, bool]:
+            changed = bool(lines)
+            lines.clear()
+            return True, changed
+
+        return self.store.update(self.db, user_id, mutate)
+
+    def apply_operations(self, user_id: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        product_ids = operation_product_ids(operations)
+        stock = self._stock(product_ids)
+
+        def mutate(lines: Dict[str, CartLine]) -> Tuple[None, bool]:
+            current = {product_id: lines[product_id].quantity for product_id in product_ids if product_id in lines}
+            removed, changed = plan_operations(operations, stock, current)
+            for product_id in removed:
+                del lines[product_id]
+            now = datetime.utcnow()
+            for product_id, quantity in changed.items():
+                line = lines.get(product_id)
+                lines[product_id] = (
+                    line._replace(quantity=quantity) if line else CartLine(str(uuid.uuid4()), quantity, now)
+                )
+            return None, bool(removed or changed)
+
+        self.store.update(self.db, user_id, mutate)
+        return self.get_cart(user_id)
+
+    def get_cart_items_count(self, user_id: str) -> int:
+        return self.get_cart(user_id, include_items=False)["items_count"]
+
+
+# Хранилища корзин по settings.cart_storage
+CART_REPOSITORIES = {
+    "sql": CartRepository,
+    "memory": MemoryCartRepository,
+}
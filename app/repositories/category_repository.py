@@ -1,9 +1,36 @@
+import time
 from typing import Optional, Dict, Any, List, Set
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import asc, desc, func
+from sqlalchemy import asc, desc, func, select, literal, String, Select, update, case
 
+from app.core.config import settings
 from app.models.category import Category
 from app.models.product import Product
+from app.repositories.category_tree_cache import category_tree_cache, CategoryTreeSnapshot, CategoryNode
+from app.repositories.suggest_index import suggest_index
+
+
+def subcategory_ids_query(category_id: str) -> Select:
+    """
+    Запрос ID категории и всех её подкатегорий одним WITH RECURSIVE.
+    UNION (а не UNION ALL) отбрасывает повторы, поэтому цикл в дереве не зациклит запрос
+    """
+    subtree = select(literal(category_id, String).label("id")).cte("category_subtree", recursive=True)
+    subtree = subtree.union(
+        select(Category.id).where(Category.parent_id == subtree.c.id)
+    )
+    return select(subtree.c.id)
+
+
+def ancestor_ids_query(category_id: str) -> Select:
+    """Запрос ID категории и всех её предков одним WITH RECURSIVE"""
+    chain = select(Category.id, Category.parent_id).where(
+        Category.id == category_id
+    ).cte("category_ancestors", recursive=True)
+    chain = chain.union(
+        select(Category.id, Category.parent_id).where(Category.id == chain.c.parent_id)
+    )
+    return select(chain.c.id)
 
 
 class CategoryRepository:
@@ -29,6 +56,8 @@ class CategoryRepository:
         if category.parent_id:
             self.update_children_count(category.parent_id)
 
+        category_tree_cache.invalidate()
+        suggest_index.upsert_category(category.id, category.name)
         return category
 
     def update(self, category_id: str, update_data: Dict[str, Any]) -> Optional[Category]:
@@ -50,6 +79,9 @@ class CategoryRepository:
                 if new_parent_id:
                     self.update_children_count(new_parent_id)
 
+            category_tree_cache.invalidate()
+            suggest_index.upsert_category(category.id, category.name)
+
         return category
 
     def delete(self, category_id: str) -> bool:
@@ -74,6 +106,8 @@ class CategoryRepository:
             if parent_id:
                 self.update_children_count(parent_id)
 
+            category_tree_cache.invalidate()
+            suggest_index.remove_category(category_id)
             return True
         return False
 
@@ -84,6 +118,7 @@ class CategoryRepository:
         if category:
             category.children_count = children_count
             self.db.commit()
+            category_tree_cache.patch_counts({category_id: {"children_count": children_count}})
 
     def get_all_categories(self, include_children: bool = False) -> List[Category]:
         query = self.db.query(Category)
@@ -91,25 +126,28 @@ class CategoryRepository:
             query = query.options(joinedload(Category.children))
         return query.all()
 
+    def get_tree_snapshot(self) -> Optional[CategoryTreeSnapshot]:
+        """Снимок дерева категорий из кэша (None, если кэш отключен)"""
+        if not settings.category_cache_enabled:
+            return None
+        return category_tree_cache.get(self.db)
+
+    def get_node(self, category_id: str) -> Optional[CategoryNode]:
+        """Категория из снимка дерева (без обращения к БД, если снимок загружен)"""
+        snapshot = self.get_tree_snapshot()
+        if snapshot is None:
+            return self.get_by_id(category_id)
+        return snapshot.get(category_id)
+
     def get_all_subcategory_ids(self, category_id: str) -> Set[str]:
         """
-        Рекурсивно получает все ID подкатегорий для заданной категории
+        Получает все ID подкатегорий для заданной категории (включая её саму):
+        из снимка дерева или одним запросом
         """
-
-        def get_children_ids(parent_id: str) -> Set[str]:
-            children = self.db.query(Category).filter(Category.parent_id == parent_id).all()
-            children_ids = {child.id for child in children}
-
-            # Рекурсивно получаем ID детей детей
-            for child in children:
-                children_ids.update(get_children_ids(child.id))
-
-            return children_ids
-
-        # Начинаем с основной категории и получаем все дочерние
-        all_ids = {category_id}
-        all_ids.update(get_children_ids(category_id))
-        return all_ids
+        snapshot = self.get_tree_snapshot()
+        if snapshot is not None:
+            return set(snapshot.subtree_ids(category_id))
+        return set(self.db.execute(subcategory_ids_query(category_id)).scalars())
 
     def get_category_with_all_children(self, category_id: str) -> List[str]:
         """
@@ -125,19 +163,27 @@ class CategoryRepository:
         """Получение дочерних категорий"""
         return self.db.query(Category).filter(Category.parent_id == category_id).all()
 
-    def get_category_tree(self) -> List[Category]:
-        """Получение дерева категорий (рекурсивно)"""
-
-        def build_tree(parent_id: Optional[str] = None) -> List[Category]:
-            categories = self.db.query(Category).filter(Category.parent_id == parent_id).all()
-            for category in categories:
-                category.children = build_tree(category.id)
-            return categories
-
-        return build_tree()
+    def get_category_tree(self, root_id: Optional[str] = None, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Получение дерева категорий: все категории загружаются одним запросом
+        (или берутся из снимка) и собираются в дерево в памяти
+        """
+        snapshot = self.get_tree_snapshot()
+        if snapshot is None:
+            snapshot = category_tree_cache.load(self.db)
+        return snapshot.build_tree(root_id, max_depth)
 
-    def get_category_with_children(self, category_id: str) -> Optional[Category]:
+    def get_category_with_children(self, category_id: str) -> Optional[Any]:
         """Получение категории с дочерними элементами"""
+        snapshot = self.get_tree_snapshot()
+        if snapshot is not None:
+            node = snapshot.get(category_id)
+            if not node:
+                return None
+            category = node.to_dict()
+            category["children"] = [child.to_dict() for child in snapshot.get_children(category_id)]
+            return category
+
         category = self.get_by_id(category_id)
         if category:
             category.children = self.get_children(category_id)
@@ -158,17 +204,91 @@ class CategoryRepository:
         if category:
             category.product_count = total_product_count
             self.db.commit()
+            category_tree_cache.patch_counts({category_id: {"product_count": total_product_count}})
 
         return total_product_count
 
-    def update_all_product_counts(self) -> None:
-        """Обновляет счетчики продуктов для всех категорий"""
-        categories = self.get_all_categories()
+    def rebuild_all_counters(self) -> Dict[str, Any]:
+        """
+        Пересчитывает product_count и children_count всех категорий за один проход:
+        прямые счетчики берутся двумя GROUP BY, суммы по поддеревьям считаются в памяти
+        снизу вверх, изменившиеся строки записываются одним пакетным UPDATE
+        """
+        started = time.perf_counter()
+
+        categories = self.db.query(
+            Category.id,
+            Category.parent_id,
+            Category.product_count,
+            Category.children_count
+        ).all()
+
+        direct_products = dict(
+            self.db.query(Product.category_id, func.count(Product.id))
+            .filter(Product.category_id.isnot(None))
+            .group_by(Product.category_id)
+            .all()
+        )
+        direct_children = dict(
+            self.db.query(Category.parent_id, func.count(Category.id))
+            .filter(Category.parent_id.isnot(None))
+            .group_by(Category.parent_id)
+            .all()
+        )
+
+        parent_of = {category.id: category.parent_id for category in categories}
+        children_of: Dict[Optional[str], List[str]] = {}
+        for category_id, parent_id in parent_of.items():
+            children_of.setdefault(parent_id if parent_id in parent_of else None, []).append(category_id)
+
+        # Обход в ширину от корней; в обратном порядке каждый узел идет раньше своего родителя
+        order = list(children_of.get(None, []))
+        for category_id in order:
+            order.extend(children_of.get(category_id, []))
+
+        product_totals = {category_id: direct_products.get(category_id, 0) for category_id in parent_of}
+        for category_id in reversed(order):
+            parent_id = parent_of[category_id]
+            if parent_id in product_totals:
+                product_totals[parent_id] += product_totals[category_id]
+
+        changes = []
         for category in categories:
-            self.update_product_count(category.id)
+            product_count = product_totals[category.id]
+            children_count = direct_children.get(category.id, 0)
+            if category.product_count != product_count or category.children_count != children_count:
+                changes.append({
+                    "id": category.id,
+                    "product_count": product_count,
+                    "children_count": children_count
+                })
+
+        if changes:
+            self.db.execute(update(Category), changes)
+            self.db.commit()
+            category_tree_cache.patch_counts({
+                change["id"]: {
+                    "product_count": change["product_count"],
+                    "children_count": change["children_count"]
+                }
+                for change in changes
+            })
+
+        return {
+            "categories": len(categories),
+            "updated": len(changes),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
 
     def update_product_counts_for_category_tree(self, category_id: str) -> None:
-        """Рекурсивно обновляет счетчики продуктов для категории и всех её родителей"""
+        """Обновляет счетчики продуктов для категории и всех её родителей"""
+        snapshot = self.get_tree_snapshot()
+        if snapshot is not None:
+            # Цепочка предков берется из снимка дерева без обхода по БД
+            for ancestor_id in snapshot.ancestor_ids(category_id):
+                self.update_product_count(ancestor_id)
+            return
+
         category = self.get_by_id(category_id)
         if not category:
             return
@@ -180,6 +300,59 @@ class CategoryRepository:
         if category.parent_id:
             self.update_product_counts_for_category_tree(category.parent_id)
 
+    def get_ancestor_ids(self, category_id: str) -> List[str]:
+        """ID категории и всех её предков: из снимка дерева или одним запросом"""
+        snapshot = self.get_tree_snapshot()
+        if snapshot is not None:
+            return list(snapshot.ancestor_ids(category_id))
+        return list(self.db.execute(ancestor_ids_query(category_id)).scalars())
+
+    def get_product_count_deltas(self, old_category_id: Optional[str],
+                                 new_category_id: Optional[str]) -> Dict[str, int]:
+        """
+        Приращения product_count при переносе продукта из old_category_id в new_category_id
+        (None - продукт удаляется или создается). Общие предки взаимно компенсируются
+        """
+        deltas: Dict[str, int] = {}
+        if old_category_id:
+            for ancestor_id in self.get_ancestor_ids(old_category_id):
+                deltas[ancestor_id] = deltas.get(ancestor_id, 0) - 1
+        if new_category_id:
+            for ancestor_id in self.get_ancestor_ids(new_category_id):
+                deltas[ancestor_id] = deltas.get(ancestor_id, 0) + 1
+        return {category_id: delta for category_id, delta in deltas.items() if delta}
+
+    def shift_product_counts(self, deltas: Dict[str, int]) -> Optional[Dict[str, int]]:
+        """
+        Применяет приращения product_count одним UPDATE без commit, в транзакции
+        вызывающего кода. Возвращает новые значения счетчиков, если СУБД поддерживает RETURNING
+        """
+        if not deltas:
+            return {}
+
+        statement = update(Category).where(
+            Category.id.in_(list(deltas))
+        ).values(
+            product_count=func.coalesce(Category.product_count, 0) + case(deltas, value=Category.id, else_=0)
+        ).execution_options(synchronize_session=False)
+
+        if not self.db.get_bind().dialect.update_returning:
+            self.db.execute(statement)
+            return None
+
+        rows = self.db.execute(statement.returning(Category.id, Category.product_count)).all()
+        return {row.id: row.product_count for row in rows}
+
+    def publish_product_counts(self, counts: Optional[Dict[str, int]]) -> None:
+        """Переносит закоммиченные счетчики продуктов в снимок дерева категорий"""
+        if counts is None:
+            category_tree_cache.invalidate()
+        elif counts:
+            category_tree_cache.patch_counts({
+                category_id: {"product_count": product_count}
+                for category_id, product_count in counts.items()
+            })
+
     def search_categories(self, search_term: str) -> List[Category]:
         """Поиск категорий по названию"""
         return self.db.query(Category).filter(Category.name.ilike(f"%{search_term}%")).all()
\ No newline at end of file
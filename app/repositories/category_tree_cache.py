@@ -0,0 +1,221 @@
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Optional, Dict, Any, List, Tuple, FrozenSet
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.category import Category
+
+
+@dataclass(frozen=True)
+class CategoryNode:
+    """Неизменяемая копия строки категории"""
+    id: str
+    name: str
+    description: Optional[str]
+    parent_id: Optional[str]
+    icon: Optional[str]
+    color: Optional[str]
+    product_count: int
+    children_count: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "parent_id": self.parent_id,
+            "icon": self.icon,
+            "color": self.color,
+            "product_count": self.product_count,
+            "children_count": self.children_count
+        }
+
+
+class CategoryTreeSnapshot:
+    """
+    Неизменяемый снимок таблицы категорий: узлы, связи родитель -> дети,
+    цепочки предков и множества ID поддеревьев (вычисляются лениво и запоминаются)
+    """
+
+    def __init__(self, version: int, nodes: Dict[str, CategoryNode],
+                 children: Optional[Dict[Optional[str], Tuple[str, ...]]] = None):
+        self.version = version
+        self.nodes = nodes
+
+        if children is None:
+            building: Dict[Optional[str], List[str]] = {}
+            for node in nodes.values():
+                parent_id = node.parent_id if node.parent_id in nodes else None
+                building.setdefault(parent_id, []).append(node.id)
+            children = {parent_id: tuple(ids) for parent_id, ids in building.items()}
+        self.children = children
+
+        self._subtrees: Dict[str, FrozenSet[str]] = {}
+        self._ancestors: Dict[str, Tuple[str, ...]] = {}
+
+    def get(self, category_id: str) -> Optional[CategoryNode]:
+        return self.nodes.get(category_id)
+
+    def get_children(self, category_id: Optional[str]) -> List[CategoryNode]:
+        return [self.nodes[child_id] for child_id in self.children.get(category_id, ())]
+
+    def subtree_ids(self, category_id: str) -> FrozenSet[str]:
+        """ID категории и всех её подкатегорий"""
+        cached = self._subtrees.get(category_id)
+        if cached is not None:
+            return cached
+
+        ids = {category_id}
+        stack = [category_id]
+        while stack:
+            for child_id in self.children.get(stack.pop(), ()):
+                if child_id not in ids:
+                    ids.add(child_id)
+                    stack.append(child_id)
+
+        result = frozenset(ids)
+        self._subtrees[category_id] = result
+        return result
+
+    def ancestor_ids(self, category_id: str) -> Tuple[str, ...]:
+        """Цепочка от категории до корня (включая саму категорию)"""
+        cached = self._ancestors.get(category_id)
+        if cached is not None:
+            return cached
+
+        chain = []
+        current = category_id
+        while current in self.nodes and current not in chain:
+            chain.append(current)
+            current = self.nodes[current].parent_id
+
+        result = tuple(chain)
+        self._ancestors[category_id] = result
+        return result
+
+    def build_tree(self, root_id: Optional[str] = None, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Дерево категорий в виде вложенных словарей за O(n) без рекурсии.
+        root_id - вернуть только поддерево этой категории (она будет единственным корнем),
+        max_depth - количество уровней в ответе (1 - только корни)
+        """
+        if root_id is None:
+            top_level = self.get_children(None)
+        else:
+            root = self.nodes.get(root_id)
+            top_level = [root] if root else []
+
+        tree: List[Dict[str, Any]] = []
+        stack = [(node, tree, 1) for node in reversed(top_level)]
+        while stack:
+            node, siblings, depth = stack.pop()
+            node_dict = node.to_dict()
+            node_dict["children"] = []
+            siblings.append(node_dict)
+
+            if max_depth is None or depth < max_depth:
+                for child in reversed(self.get_children(node.id)):
+                    stack.append((child, node_dict["children"], depth + 1))
+
+        return tree
+
+    def with_counts(self, version: int, counts: Dict[str, Dict[str, int]]) -> "CategoryTreeSnapshot":
+        """Новый снимок с измененными счетчиками; структура дерева переиспользуется"""
+        nodes = dict(self.nodes)
+        for category_id, values in counts.items():
+            node = nodes.get(category_id)
+            if node:
+                nodes[category_id] = replace(node, **values)
+
+        snapshot = CategoryTreeSnapshot(version, nodes, self.children)
+        snapshot._subtrees = self._subtrees
+        snapshot._ancestors = self._ancestors
+        return snapshot
+
+
+class CategoryTreeCache:
+    """
+    Кэш снимка дерева категорий в памяти процесса.
+    Изменения структуры сбрасывают снимок, изменения счетчиков патчат его.
+    TTL ограничивает устаревание, если запись идет через другой процесс
+    """
+
+    def __init__(self, ttl_seconds: float = 0):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[CategoryTreeSnapshot] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        # Растет при каждом изменении из записи; снимок, загруженный до изменения, не сохраняется
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> CategoryTreeSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or self._is_expired():
+            snapshot = self.rebuild(db)
+        return snapshot
+
+    def rebuild(self, db: Session) -> CategoryTreeSnapshot:
+        """
+        Перезагружает снимок в кэше. Если во время загрузки пришли invalidate или patch_counts,
+        загруженный снимок может их не содержать: он возвращается вызывающему, но не сохраняется
+        """
+        with self._lock:
+            generation = self._generation
+        nodes = self._load_nodes(db)
+        with self._lock:
+            self._version += 1
+            snapshot = CategoryTreeSnapshot(self._version, nodes)
+            if self._generation == generation:
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+        return snapshot
+
+    def load(self, db: Session) -> CategoryTreeSnapshot:
+        """Загружает снимок без сохранения в кэше"""
+        return CategoryTreeSnapshot(0, self._load_nodes(db))
+
+    @staticmethod
+    def _load_nodes(db: Session) -> Dict[str, CategoryNode]:
+        """Загружает всю таблицу категорий одним запросом"""
+        rows = db.query(
+            Category.id,
+            Category.name,
+            Category.description,
+            Category.parent_id,
+            Category.icon,
+            Category.color,
+            Category.product_count,
+            Category.children_count
+        ).all()
+
+        nodes = {}
+        for row in rows:
+            values = dict(row._mapping)
+            values["product_count"] = values["product_count"] or 0
+            values["children_count"] = values["children_count"] or 0
+            nodes[row.id] = CategoryNode(**values)
+        return nodes
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def patch_counts(self, counts: Dict[str, Dict[str, int]]) -> None:
+        """Обновляет счетчики категорий в снимке (если он загружен)"""
+        with self._lock:
+            self._generation += 1
+            if self._snapshot is None:
+                return
+            self._version += 1
+            self._snapshot = self._snapshot.with_counts(self._version, counts)
+
+    def _is_expired(self) -> bool:
+        return self.ttl_seconds > 0 and time.monotonic() - self._loaded_at > self.ttl_seconds
+
+
+category_tree_cache = CategoryTreeCache(ttl_seconds=settings.category_cache_ttl_seconds)
@@ -1,10 +1,21 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Set, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, delete, select, func, type_coerce, String
 
+from app.core.pagination import encode_cursor, decode_cursor
 from app.models.favorite import Favorite
 from app.models.product import Product
 
+# Поля продукта в списке избранного: full - все, brief - без описания и изображений
+FAVORITE_PRODUCT_FIELDS = {
+    "full": (
+        Product.article, Product.title, Product.description, Product.price,
+        Product.image_urls, Product.stock_quantity
+    ),
+    "brief": (Product.article, Product.title, Product.price, Product.stock_quantity),
+}
+
 
 class FavoriteRepository:
     def __init__(self, db: Session):
@@ -49,6 +60,110 @@ class FavoriteRepository:
 
         return favorites_with_products
 
+    def get_favorites_page(
+            self,
+            user_id: str,
+            count: int = 20,
+            cursor: Optional[str] = None,
+            fields: str = "full"
+    ) -> Dict[str, Any]:
+        """
+        Страница избранного пользователя из count записей, новые первыми, с общим количеством
+        в том же запросе. cursor - курсор (created_at, id) из next_cursor предыдущей страницы;
+        без него - первая страница. fields: full или brief (без описания и изображений)
+        """
+        if fields not in FAVORITE_PRODUCT_FIELDS:
+            raise ValueError(f"Unknown fields: {fields}")
+
+        created_at = self._created_at_key()
+        total_count = select(func.count()).where(Favorite.user_id == user_id).scalar_subquery()
+        query = self.db.query(
+            Favorite.id,
+            Favorite.user_id,
+            Favorite.product_id,
+            Favorite.created_at,
+            created_at.label("created_at_key"),
+            *FAVORITE_PRODUCT_FIELDS[fields],
+            total_count.label("total_count")
+        ).join(
+            Product, Favorite.product_id == Product.id
+        ).filter(
+            Favorite.user_id == user_id
+        )
+
+        if cursor:
+            position, favorite_id = self._decode_favorites_cursor(cursor, created_at)
+            query = query.filter(or_(
+                created_at < position,
+                and_(created_at == position, Favorite.id < favorite_id)
+            ))
+        query = query.order_by(created_at.desc(), Favorite.id.desc())
+
+        rows = query.limit(count + 1).all()
+        has_more = len(rows) > count
+        if has_more:
+            rows = rows[:count]
+
+        if rows:
+            total = rows[0].total_count
+        elif not cursor:
+            total = 0
+        else:
+            # Страница за концом списка: строк с подсчетом нет
+            total = self.get_favorite_count(user_id)
+
+        next_cursor = None
+        if has_more:
+            position = rows[-1].created_at_key
+            next_cursor = encode_cursor({
+                "created_at": position if isinstance(position, str) else position.isoformat(),
+                "id": rows[-1].id
+            })
+
+        product_fields = [column.key for column in FAVORITE_PRODUCT_FIELDS[fields]]
+        favorites = [
+            {
+                "id": row.id,
+                "user_id": row.user_id,
+                "product_id": row.product_id,
+                "created_at": row.created_at,
+                "product": self._favorite_product(row, product_fields)
+            }
+            for row in rows
+        ]
+        return {"favorites": favorites, "total": total, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _favorite_product(row, product_fields: List[str]) -> Dict[str, Any]:
+        product = {"id": row.product_id}
+        for field in product_fields:
+            product[field] = getattr(row, field)
+        if "image_urls" in product:
+            product["image_urls"] = product["image_urls"] or []
+        return product
+
+    def _created_at_key(self):
+        """
+        created_at для курсора. SQLite хранит дату текстом в формате того, кто вставил строку
+        (server_default - без микросекунд), а параметр DateTime передается с микросекундами,
+        поэтому в SQLite сравнивается сохраненная строка как есть
+        """
+        if self.db.get_bind().dialect.name == "sqlite":
+            return type_coerce(Favorite.created_at, String)
+        return Favorite.created_at
+
+    @staticmethod
+    def _decode_favorites_cursor(cursor: str, created_at):
+        position = decode_cursor(cursor)
+        if not isinstance(position.get("created_at"), str) or not isinstance(position.get("id"), str):
+            raise ValueError("Invalid cursor")
+        if isinstance(created_at.type, String):
+            return position["created_at"], position["id"]
+        try:
+            return datetime.fromisoformat(position["created_at"]), position["id"]
+        except ValueError:
+            raise ValueError("Invalid cursor")
+
     def add_to_favorites(self, user_id: str, product_id: str) -> Favorite:
         favorite = Favorite(user_id=user_id, product_id=product_id)
         self.db.add(favorite)
@@ -64,9 +179,27 @@ class FavoriteRepository:
             return True
         return False
 
+    def clear_favorites(self, user_id: str) -> int:
+        """Удаляет все избранное пользователя одним DELETE"""
+        result = self.db.execute(
+            delete(Favorite)
+            .where(Favorite.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount
+
     def is_product_in_favorites(self, user_id: str, product_id: str) -> bool:
         favorite = self.get_by_user_and_product(user_id, product_id)
         return favorite is not None
 
+    def get_favorite_product_ids(self, user_id: str, product_ids: List[str]) -> Set[str]:
+        """Какие из product_ids в избранном пользователя - одним запросом с IN"""
+        if not product_ids:
+            return set()
+        return set(self.db.scalars(
+            select(Favorite.product_id).where(Favorite.user_id == user_id, Favorite.product_id.in_(product_ids))
+        ))
+
     def get_favorite_count(self, user_id: str) -> int:
         return self.db.query(Favorite).filter(Favorite.user_id == user_id).count()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Any
+
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+
+from app.core.background import PeriodicTask
+from app.core.config import settings
+from app.database.database import SessionLocal
+from app.models.user import User
+
+
+class LastLoginBuffer:
+    """
+    Отложенная запись времени последнего входа. Время входа копится в памяти
+    (для пользователя хранится только последнее) и записывается одним executemany UPDATE
+    раз в flush_interval секунд или при накоплении flush_size записей.
+    Буфер ограничен max_size: при переполнении record() возвращает False,
+    и вызывающий записывает время входа сразу
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], flush_interval: float,
+                 flush_size: int, max_size: int):
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self.task = PeriodicTask("last_login_flush", flush_interval, self.flush)
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self.overflows = 0
+
+    def record(self, user_id: str, logged_in_at: datetime) -> bool:
+        if not self.task.running:
+            return False
+        with self._lock:
+            if user_id not in self._pending and len(self._pending) >= self.max_size:
+                self.overflows += 1
+                return False
+            self._pending[user_id] = logged_in_at
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self.task.wake()
+        return True
+
+    def flush(self) -> int:
+        """Записывает накопленные значения; при ошибке они возвращаются в буфер"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        db = self.session_factory()
+        try:
+            # UPDATE по таблице, а не ORM bulk update: удаленные пользователи просто пропускаются
+            users = User.__table__
+            db.execute(
+                update(users).where(users.c.id == bindparam("user_id")).values(last_login=bindparam("logged_in_at")),
+                [{"user_id": user_id, "logged_in_at": logged_in_at} for user_id, logged_in_at in pending.items()]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for user_id, logged_in_at in pending.items():
+                    if user_id not in self._pending:
+                        self._pending[user_id] = logged_in_at
+            raise
+        finally:
+            db.close()
+        return len(pending)
+
+    def start(self) -> None:
+        self.task.start()
+
+    async def stop(self) -> None:
+        """Останавливает фоновую запись и сбрасывает остаток буфера"""
+        await self.task.stop()
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {**self.task.stats(), "pending": pending, "max_size": self.max_size, "overflows": self.overflows}
+
+
+last_login_buffer = LastLoginBuffer(
+    SessionLocal,
+    flush_interval=settings.last_login_flush_interval_seconds,
+    flush_size=settings.last_login_flush_size,
+    max_size=settings.last_login_buffer_max_size
+)
@@ -1,9 +1,27 @@
 from typing import Optional, Dict, Any, List, Set
 from sqlalchemy.orm import Session, Query
-from sqlalchemy import asc, desc, or_, func
+from sqlalchemy import asc, desc, or_, and_, func, select, update
 
+from app.core.config import settings
+from app.core.pagination import encode_cursor, decode_cursor
+from app.database.fts import index_product, unindex_product, build_match_expression, match_query, match_ids_query
 from app.models.product import Product
 from app.models.category import Category
+from app.repositories.category_repository import CategoryRepository, subcategory_ids_query
+from app.repositories.stock_reservation_repository import available_quantity
+from app.repositories.suggest_index import suggest_index
+
+# Колонки, по которым допускается курсорная пагинация
+KEYSET_SORT_FIELDS = ("id", "article", "title", "description", "price", "category_id", "stock_quantity")
+
+# Поддерево категорий большего размера фильтруется подзапросом, а не списком IN
+CATEGORY_IN_LIST_LIMIT = 500
+
+# Сортировка по релевантности поиска по названию
+RELEVANCE_SORT = "relevance"
+
+# Режимы подсчета общего количества в списке продуктов
+TOTAL_MODES = ("exact", "estimate", "none")
 
 
 class ProductRepository:
@@ -17,14 +35,15 @@ class ProductRepository:
         """Получает продукт с названием категории в виде словаря"""
         result = self.db.query(
             Product,
-            Category.name.label('category_name')
+            Category.name.label('category_name'),
+            available_quantity.label('available_quantity')
         ).outerjoin(
             Category, Product.category_id == Category.id
         ).filter(Product.id == product_id).first()
 
         if result:
-            product, category_name = result
-            return self._product_to_dict(product, category_name)
+            product, category_name, available = result
+            return self._product_to_dict(product, category_name, available)
         return None
 
     def get_by_article(self, article: int) -> Optional[Product]:
@@ -40,107 +59,164 @@ class ProductRepository:
 
         product = Product(**product_data)
         self.db.add(product)
+        self.db.flush()
+
+        index_product(self.db, product.id, product.title, product.description)
+
+        # Счетчики продуктов категории и её родителей меняются в той же транзакции
+        category_repo = CategoryRepository(self.db)
+        counts = category_repo.shift_product_counts(
+            category_repo.get_product_count_deltas(None, product.category_id)
+        )
+
         self.db.commit()
         self.db.refresh(product)
 
-        # Обновляем счетчики продуктов в категории и её родителях
-        if product.category_id:
-            from app.repositories.category_repository import CategoryRepository
-            category_repo = CategoryRepository(self.db)
-            category_repo.update_product_counts_for_category_tree(product.category_id)
-
+        category_repo.publish_product_counts(counts)
+        suggest_index.upsert_product(product.id, product.title, product.article)
         return product
 
     def update(self, product_id: str, update_data: Dict[str, Any]) -> Optional[Product]:
-        old_product = self.get_by_id(product_id)
-        old_category_id = old_product.category_id if old_product else None
-
+        """
+        Обновляет продукт. Остаток меньше зарезервированного - ValueError: доступный остаток
+        стал бы отрицательным. Проверка и запись остатка - один условный UPDATE
+        """
         product = self.get_by_id(product_id)
         if product:
+            old_category_id = product.category_id
+            update_data = dict(update_data)
+            if update_data.get("stock_quantity") is not None:
+                stock_quantity = update_data.pop("stock_quantity")
+                result = self.db.execute(
+                    update(Product)
+                    .where(Product.id == product_id, Product.reserved_quantity <= stock_quantity)
+                    .values(stock_quantity=stock_quantity)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    self.db.rollback()
+                    raise ValueError("Stock quantity cannot be less than reserved quantity")
+
             for field, value in update_data.items():
                 if hasattr(product, field):
                     setattr(product, field, value)
-            self.db.commit()
-            self.db.refresh(product)
 
-            # Обновляем счетчики продуктов если изменилась категория
-            new_category_id = product.category_id
-            if old_category_id != new_category_id:
-                from app.repositories.category_repository import CategoryRepository
-                category_repo = CategoryRepository(self.db)
+            if "title" in update_data or "description" in update_data:
+                index_product(self.db, product.id, product.title, product.description)
+
+            # Если изменилась категория, переносим продукт в счетчиках старой и новой ветки
+            category_repo = CategoryRepository(self.db)
+            counts = category_repo.shift_product_counts(
+                category_repo.get_product_count_deltas(old_category_id, product.category_id)
+            )
 
-                # Обновляем старую категорию и её родителей
-                if old_category_id:
-                    category_repo.update_product_counts_for_category_tree(old_category_id)
+            self.db.commit()
+            self.db.refresh(product)
 
-                # Обновляем новую категорию и её родителей
-                if new_category_id:
-                    category_repo.update_product_counts_for_category_tree(new_category_id)
+            category_repo.publish_product_counts(counts)
+            suggest_index.upsert_product(product.id, product.title, product.article)
 
         return product
 
     def delete(self, product_id: str) -> bool:
         product = self.get_by_id(product_id)
         if product:
-            category_id = product.category_id
+            category_repo = CategoryRepository(self.db)
+            counts = category_repo.shift_product_counts(
+                category_repo.get_product_count_deltas(product.category_id, None)
+            )
 
+            unindex_product(self.db, product.id)
             self.db.delete(product)
             self.db.commit()
 
-            # Обновляем счетчики продуктов в категории и её родителях
-            if category_id:
-                from app.repositories.category_repository import CategoryRepository
-                category_repo = CategoryRepository(self.db)
-                category_repo.update_product_counts_for_category_tree(category_id)
-
+            category_repo.publish_product_counts(counts)
+            suggest_index.remove_product(product_id)
             return True
         return False
 
-    def get_paginated(
+    def get_page_with_total(
             self,
-            page: int,
             count: int,
             filters: Optional[Dict[str, Any]] = None,
             sort: str = "id",
-            order: str = "asc"
-    ) -> List[Dict[str, Any]]:
-        """Получение продуктов с названиями категорий в виде словарей"""
-        # Создаем запрос с join для получения названия категории
-        query = self.db.query(
-            Product,
-            Category.name.label('category_name')
-        ).outerjoin(
-            Category, Product.category_id == Category.id
-        )
-
-        # Применяем фильтры
-        if filters:
-            query = self._apply_filters(query, filters)
-
-        # Применяем сортировку
-        query = self._apply_sorting_with_join(query, sort, order)
-
-        # Применяем пагинацию
-        offset = (page - 1) * count
-        results = query.offset(offset).limit(count).all()
-
-        # Преобразуем в словари
-        products_dict = []
-        for product, category_name in results:
-            products_dict.append(self._product_to_dict(product, category_name))
-
-        return products_dict
+            order: str = "asc",
+            page: int = 1,
+            cursor: Optional[str] = None,
+            total_mode: str = "exact"
+    ) -> Dict[str, Any]:
+        """
+        Получение страницы продуктов вместе с общим количеством за один запрос.
+        При cursor != None используется курсорная пагинация (пустая строка - первая страница).
+        total_mode: exact - точное количество, estimate - подсчет не дальше
+        settings.products_total_estimate_limit записей, none - без подсчета
+        """
+        if total_mode not in TOTAL_MODES:
+            raise ValueError(f"Unknown total mode: {total_mode}")
 
-    def get_total_count(self, filters: Optional[Dict[str, Any]] = None) -> int:
-        query = self.db.query(Product)
+        keyset = cursor is not None
+        if keyset and sort == RELEVANCE_SORT:
+            raise ValueError("Relevance sort is not supported with cursor pagination")
+        column = self._keyset_sort_column(sort)
+        descending = order.lower() == "desc"
 
-        if filters:
-            query = self._apply_filters(query, filters)
+        # Фильтры (включая поиск подкатегорий) применяются один раз
+        filtered = self._listing_query(filters)
 
-        return query.count()
+        if keyset:
+            query = self._apply_keyset(filtered, column, descending, cursor)
+        else:
+            query = self._apply_sorting_with_join(filtered, sort, order, filters)
+
+        estimate_limit = settings.products_total_estimate_limit
+        if total_mode == "exact":
+            # Оконная функция считает строки до LIMIT; в курсорном режиме условие
+            # курсора сужает выборку, поэтому считаем по отфильтрованному подзапросу
+            total_column = self._count_subquery(filtered) if keyset else func.count().over()
+            query = query.add_columns(total_column.label("total_count"))
+        elif total_mode == "estimate":
+            query = query.add_columns(self._count_subquery(filtered, estimate_limit).label("total_count"))
+
+        offset = 0 if keyset else (page - 1) * count
+        if keyset:
+            rows = query.limit(count + 1).all()
+        else:
+            rows = query.offset(offset).limit(count).all()
+
+        has_more = keyset and len(rows) > count
+        rows = rows[:count]
+
+        total = None
+        total_exact = False
+        if total_mode != "none":
+            if rows:
+                total = rows[0].total_count
+            elif (keyset and not cursor) or (not keyset and page == 1):
+                total = 0
+            else:
+                # Страница за пределами выборки: строк с подсчетом нет, считаем отдельно
+                limit = estimate_limit if total_mode == "estimate" else None
+                total = self.db.query(self._count_subquery(filtered, limit)).scalar()
+
+            total_exact = total_mode == "exact" or total < estimate_limit
+            if not total_exact and rows:
+                # Оценка не может быть меньше уже пройденных записей
+                total = max(total, offset + len(rows))
+
+        next_cursor = None
+        if has_more:
+            next_cursor = self._next_cursor(rows[-1][0], column, descending)
+
+        return {
+            "products": [self._product_to_dict(row[0], row[1], row.available_quantity) for row in rows],
+            "total": total,
+            "total_exact": total_exact,
+            "next_cursor": next_cursor
+        }
 
-    def _product_to_dict(self, product: Product, category_name: Optional[str] = None) -> Dict[str, Any]:
-        """Преобразует объект Product в словарь"""
+    def _product_to_dict(self, product: Product, category_name: Optional[str] = None,
+                         available: Optional[int] = None) -> Dict[str, Any]:
+        """Преобразует объект Product в словарь; available - доступный остаток за вычетом резервов"""
         product_dict = {
             "id": product.id,
             "article": product.article,
@@ -150,6 +226,7 @@ class ProductRepository:
             "category_id": product.category_id,
             "image_urls": product.image_urls or [],
             "stock_quantity": product.stock_quantity,
+            "available_quantity": available,
             "category_name": category_name
         }
         return product_dict
@@ -170,6 +247,12 @@ class ProductRepository:
                 # Фильтр по категории (включая подкатегории)
                 query = self._apply_category_filter(query, value)
                 continue
+            elif field == "title" and isinstance(value, str):
+                # Поиск по названию через полнотекстовый индекс
+                match_expression = build_match_expression(value, ["title"])
+                if match_expression:
+                    query = query.filter(Product.id.in_(match_ids_query(match_expression)))
+                    continue
 
             # Обычные фильтры
             if hasattr(Product, field):
@@ -185,41 +268,29 @@ class ProductRepository:
 
     def _apply_category_filter(self, query: Query, category_id: str) -> Query:
         """
-        Применяет фильтр по категории, включая все подкатегории
+        Применяет фильтр по категории, включая все подкатегории.
+        Небольшое поддерево берется из снимка дерева категорий,
+        большое вычисляется рекурсивным подзапросом в том же запросе
         """
-        # Получаем все ID категорий (основная + все подкатегории)
-        category_ids = self._get_all_category_ids(category_id)
+        snapshot = CategoryRepository(self.db).get_tree_snapshot()
+        if snapshot is not None:
+            category_ids = snapshot.subtree_ids(category_id)
+            if len(category_ids) <= CATEGORY_IN_LIST_LIMIT:
+                return query.filter(Product.category_id.in_(category_ids))
 
-        # Фильтруем товары по всем найденным category_id
-        return query.filter(Product.category_id.in_(category_ids))
+        return query.filter(Product.category_id.in_(subcategory_ids_query(category_id)))
 
     def _get_all_category_ids(self, category_id: str) -> List[str]:
         """
-        Рекурсивно получает все ID категорий для заданной категории
+        Получает все ID категорий для заданной категории (включая подкатегории)
         """
+        return list(CategoryRepository(self.db).get_all_subcategory_ids(category_id))
 
-        def get_children_ids(parent_id: str, ids_set: Set[str]) -> Set[str]:
-            # Находим все дочерние категории
-            children = self.db.query(Category.id).filter(Category.parent_id == parent_id).all()
-            children_ids = {child.id for child in children}
-
-            # Добавляем найденные ID
-            ids_set.update(children_ids)
-
-            # Рекурсивно ищем детей для каждой дочерней категории
-            for child_id in children_ids:
-                get_children_ids(child_id, ids_set)
-
-            return ids_set
-
-        # Начинаем с основной категории
-        all_ids = {category_id}
-        get_children_ids(category_id, all_ids)
-
-        return list(all_ids)
-
-    def _apply_sorting_with_join(self, query: Query, sort: str, order: str) -> Query:
+    def _apply_sorting_with_join(self, query: Query, sort: str, order: str,
+                                 filters: Optional[Dict[str, Any]] = None) -> Query:
         """Сортировка для запроса с join"""
+        if sort == RELEVANCE_SORT:
+            return self._apply_relevance_sorting(query, filters)
         if hasattr(Product, sort):
             column = getattr(Product, sort)
             if order.lower() == "desc":
@@ -228,12 +299,120 @@ class ProductRepository:
                 return query.order_by(asc(column))
         return query.order_by(Product.id)
 
+    def _apply_relevance_sorting(self, query: Query, filters: Optional[Dict[str, Any]]) -> Query:
+        """Сортировка по релевантности поиска по названию (bm25); без поиска - по id"""
+        search_term = (filters or {}).get("title")
+        match_expression = build_match_expression(search_term, ["title"]) if isinstance(search_term, str) else None
+        if not match_expression:
+            return query.order_by(Product.id)
+
+        ranked = match_query(match_expression).subquery()
+        return query.join(ranked, ranked.c.product_id == Product.id).order_by(ranked.c.rank, Product.id)
+
+    def _listing_query(self, filters: Optional[Dict[str, Any]] = None) -> Query:
+        """Запрос продуктов с названием категории, доступным остатком и примененными фильтрами"""
+        query = self.db.query(
+            Product,
+            Category.name.label('category_name'),
+            available_quantity.label('available_quantity')
+        ).outerjoin(
+            Category, Product.category_id == Category.id
+        )
+
+        if filters:
+            query = self._apply_filters(query, filters)
+        return query
+
+    @staticmethod
+    def _count_subquery(filtered: Query, limit: Optional[int] = None):
+        """Скалярный подзапрос количества строк выборки (не больше limit)"""
+        ids = filtered.with_entities(Product.id).order_by(None)
+        if limit is not None:
+            ids = ids.limit(limit)
+        return select(func.count()).select_from(ids.subquery()).scalar_subquery()
+
+    def _apply_keyset(self, query: Query, column, descending: bool, cursor: Optional[str]) -> Query:
+        """Применяет условие курсора и порядок сортировки курсорной пагинации"""
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get("sort") != column.key or position.get("order") != ("desc" if descending else "asc"):
+                raise ValueError("Cursor does not match sort parameters")
+            if not isinstance(position.get("id"), str):
+                raise ValueError("Invalid cursor")
+            query = query.filter(self._keyset_condition(column, descending, position.get("value"), position["id"]))
+
+        return query.order_by(*self._keyset_order(column, descending))
+
+    @staticmethod
+    def _next_cursor(product: Product, column, descending: bool) -> str:
+        """Курсор страницы, следующей за product"""
+        return encode_cursor({
+            "sort": column.key,
+            "order": "desc" if descending else "asc",
+            "value": getattr(product, column.key),
+            "id": product.id
+        })
+
+    @staticmethod
+    def _keyset_sort_column(sort: str):
+        """Колонка сортировки для курсорной пагинации"""
+        if sort in KEYSET_SORT_FIELDS:
+            return getattr(Product, sort)
+        return Product.id
+
+    @staticmethod
+    def _keyset_order(column, descending: bool) -> list:
+        """
+        Порядок сортировки для курсорной пагинации: колонка сортировки + Product.id.
+        NULL явно ставятся в начало при asc и в конец при desc, чтобы порядок
+        не зависел от СУБД
+        """
+        if column is Product.id:
+            return [desc(Product.id) if descending else asc(Product.id)]
+        if descending:
+            return [desc(column).nulls_last(), desc(Product.id)]
+        return [asc(column).nulls_first(), asc(Product.id)]
+
+    @staticmethod
+    def _keyset_condition(column, descending: bool, value: Any, last_id: str):
+        """Условие: запись идет строго после (value, last_id) в порядке _keyset_order"""
+        if column is Product.id:
+            return Product.id < last_id if descending else Product.id > last_id
+
+        if descending:
+            if value is None:
+                return and_(column.is_(None), Product.id < last_id)
+            return or_(
+                column < value,
+                and_(column == value, Product.id < last_id),
+                column.is_(None)
+            )
+
+        if value is None:
+            return or_(
+                and_(column.is_(None), Product.id > last_id),
+                column.isnot(None)
+            )
+        return or_(
+            column > value,
+            and_(column == value, Product.id > last_id)
+        )
+
     # Дополнительные методы
 
     def search_products(self, search_term: str, fields: List[str] = None) -> List[Dict[str, Any]]:
         if fields is None:
             fields = ["title", "description"]
 
+        # Полнотекстовый индекс с ранжированием по релевантности
+        match_expression = build_match_expression(search_term, fields)
+        if match_expression:
+            ranked = match_query(match_expression).subquery()
+            products = self.db.query(Product).join(
+                ranked, ranked.c.product_id == Product.id
+            ).order_by(ranked.c.rank, Product.id).all()
+            return [self._product_to_dict(product) for product in products]
+
         query = self.db.query(Product)
         conditions = []
 
@@ -1,6 +1,9 @@
 from typing import Optional, List
+from sqlalchemy import update, select, delete, or_, func
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from app.core.config import settings
 
 from app.models.refresh_token import RefreshToken
 
@@ -22,23 +25,118 @@ class RefreshTokenRepository:
             expires_at=expires_at
         )
         self.db.add(refresh_token)
+        self.db.flush()
+        self._revoke_over_limit(user_id, token)
         self.db.commit()
         self.db.refresh(refresh_token)
         return refresh_token
 
-    def revoke(self, token: str) -> bool:
-        refresh_token = self.get_by_token(token)
-        if refresh_token:
-            refresh_token.is_revoked = True
+    def _revoke_over_limit(self, user_id: str, new_token: str) -> None:
+        """Отзывает самые старые действующие токены пользователя сверх лимита (без commit)"""
+        limit = settings.refresh_tokens_per_user_limit
+        if limit <= 0:
+            return
+        over_limit = (
+            select(RefreshToken.id)
+            .where(
+                RefreshToken.user_id == user_id,
+                RefreshToken.token != new_token,
+                RefreshToken.is_revoked.is_not(True),
+                RefreshToken.expires_at > datetime.utcnow()
+            )
+            .order_by(RefreshToken.created_at.desc(), RefreshToken.expires_at.desc())
+            .offset(limit - 1)
+        )
+        self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.id.in_(over_limit))
+            .values(is_revoked=True, revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def purge(self, retention: timedelta, batch_size: int) -> int:
+        """
+        Удаляет токены, истекшие или отозванные раньше, чем retention назад.
+        Каждая пачка из batch_size строк удаляется в отдельной короткой транзакции
+        """
+        border = datetime.utcnow() - retention
+        stale = (
+            select(RefreshToken.id)
+            .where(or_(
+                RefreshToken.expires_at < border,
+                # Токены, отозванные до появления revoked_at, считаются по created_at
+                (RefreshToken.is_revoked.is_(True))
+                & (func.coalesce(RefreshToken.revoked_at, RefreshToken.created_at) < border)
+            ))
+            .limit(batch_size)
+        )
+
+        purged = 0
+        while True:
+            result = self.db.execute(
+                delete(RefreshToken)
+                .where(RefreshToken.id.in_(stale))
+                .execution_options(synchronize_session=False)
+            )
             self.db.commit()
-            return True
-        return False
+            purged += result.rowcount
+            if result.rowcount < batch_size:
+                return purged
+
+    def revoke(self, token: str) -> bool:
+        result = self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.token == token)
+            .values(is_revoked=True, revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount > 0
+
+    def revoke_all_user_tokens(self, user_id: str) -> int:
+        """Отзывает все действующие токены пользователя одним UPDATE"""
+        result = self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.is_revoked.is_not(True))
+            .values(is_revoked=True, revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return result.rowcount
+
+    def rotate(self, token: str, new_token: str, expires_at: datetime) -> Optional[str]:
+        """
+        Заменяет refresh token новым в одной транзакции: условный UPDATE отзывает старый токен,
+        только если он еще действует, затем вставляется новый. Из двух одновременных ротаций
+        одного токена успешна только одна. Возвращает ID пользователя или None
+        """
+        now = datetime.utcnow()
+        valid_token = (
+            RefreshToken.token == token,
+            RefreshToken.is_revoked.is_not(True),
+            RefreshToken.expires_at > now
+        )
+        statement = (
+            update(RefreshToken)
+            .where(*valid_token)
+            .values(is_revoked=True, revoked_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+        if self.db.get_bind().dialect.update_returning:
+            user_id = self.db.execute(statement.returning(RefreshToken.user_id)).scalar()
+        else:
+            user_id = self.db.execute(select(RefreshToken.user_id).where(*valid_token)).scalar()
+            if user_id is not None and self.db.execute(statement).rowcount != 1:
+                user_id = None
+
+        if user_id is None:
+            self.db.rollback()
+            return None
 
-    def revoke_all_user_tokens(self, user_id: str) -> None:
-        tokens = self.get_by_user_id(user_id)
-        for token in tokens:
-            token.is_revoked = True
+        self.db.add(RefreshToken(user_id=user_id, token=new_token, expires_at=expires_at))
         self.db.commit()
+        return user_id
 
     def is_valid(self, token: str) -> bool:
         refresh_token = self.get_by_token(token)
@@ -0,0 +1,312 @@
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Tuple
+
+from sqlalchemy import select, update, delete, insert, func
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+from app.models.stock_reservation import StockBucket, StockReservation
+
+bucket_available = StockBucket.capacity - StockBucket.reserved - StockBucket.sold
+product_available = func.coalesce(Product.stock_quantity, 0) - Product.reserved_quantity
+# Доступный остаток продукта целиком (строка продукта плюс корзины), коррелирует с products
+available_quantity = product_available + func.coalesce(
+    select(func.sum(bucket_available)).where(StockBucket.product_id == Product.id).scalar_subquery(), 0
+)
+
+
+class StockReservationRepository:
+    """
+    Резервирование остатков условными UPDATE: счетчик увеличивается, только если
+    доступного остатка хватает, поэтому продать больше остатка нельзя.
+    Остаток популярного продукта можно разделить на корзины (split): доступное количество
+    выдается из products в строки stock_buckets, и резервы расходятся по разным строкам
+    вместо одной. merge возвращает неиспользованное обратно в строку продукта.
+    Инвариант: products.reserved_quantity включает capacity всех корзин продукта
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_available(self, product_id: str) -> Optional[int]:
+        """Доступный остаток: строка продукта плюс корзины"""
+        return self.db.execute(select(available_quantity).where(Product.id == product_id)).scalar()
+
+    def _take(self, product_id: str, quantity: int) -> Tuple[bool, Optional[str]]:
+        """
+        Резервирует quantity: сначала в случайной корзине с достаточным остатком,
+        затем в строке продукта. Если остаток раздроблен по корзинам так, что ни одной не хватает,
+        корзины сливаются с продуктом. Возвращает (успех, ID корзины или None).
+        Неположительное количество - ValueError: оно уменьшило бы счетчик резерва
+        """
+        if quantity <= 0:
+            raise ValueError("Reservation quantity must be positive")
+
+        buckets = self.db.execute(
+            select(StockBucket.id, bucket_available.label("available"))
+            .where(StockBucket.product_id == product_id)
+        ).all()
+        candidates = [bucket.id for bucket in buckets if bucket.available >= quantity]
+        random.shuffle(candidates)
+        for bucket_id in candidates:
+            result = self.db.execute(
+                update(StockBucket)
+                .where(StockBucket.id == bucket_id, bucket_available >= quantity)
+                .values(reserved=StockBucket.reserved + quantity)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                return True, bucket_id
+
+        take_from_product = (
+            update(Product)
+            .where(Product.id == product_id, product_available >= quantity)
+            .values(reserved_quantity=Product.reserved_quantity + quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if self.db.execute(take_from_product).rowcount == 1:
+            return True, None
+        if any(bucket.available > 0 for bucket in buckets) and self._merge(product_id):
+            return self.db.execute(take_from_product).rowcount == 1, None
+        return False, None
+
+    def reserve(self, user_id: str, product_id: str, quantity: int, ttl: timedelta) -> Optional[str]:
+        """
+        Резервирует товар на ttl. Возвращает ID резерва или None, если продукта нет или остатка не хватает.
+        ValueError при неположительном количестве
+        """
+        taken, bucket_id = self._take(product_id, quantity)
+        if not taken:
+            self.db.rollback()
+            return None
+
+        reservation = StockReservation(
+            product_id=product_id,
+            user_id=user_id,
+            bucket_id=bucket_id,
+            quantity=quantity,
+            expires_at=datetime.utcnow() + ttl
+        )
+        self.db.add(reservation)
+        self.db.commit()
+        return reservation.id
+
+    def reserve_items(self, user_id: str, items: Dict[str, int], ttl: timedelta) -> List[Dict[str, Any]]:
+        """
+        Резервирует набор товаров {product_id: quantity} в одной транзакции, заменяя
+        прежние резервы пользователя. Если остатка не хватает хотя бы на один товар или количество
+        не положительное - ValueError, ничего не резервируется и прежние резервы сохраняются
+        """
+        invalid = [product_id for product_id, quantity in items.items() if quantity <= 0]
+        if invalid:
+            raise ValueError(f"Reservation quantity must be positive for products: {', '.join(invalid)}")
+
+        self._return_stock(self._delete_reservations(StockReservation.user_id == user_id))
+
+        expires_at = datetime.utcnow() + ttl
+        rows = []
+        short = []
+        for product_id, quantity in items.items():
+            taken, bucket_id = self._take(product_id, quantity)
+            if not taken:
+                short.append(product_id)
+                continue
+            rows.append({
+                "product_id": product_id,
+                "user_id": user_id,
+                "bucket_id": bucket_id,
+                "quantity": quantity,
+                "expires_at": expires_at
+            })
+        if short:
+            self.db.rollback()
+            raise ValueError(f"Not enough stock available for products: {', '.join(short)}")
+
+        if rows:
+            self.db.execute(insert(StockReservation), rows)
+        self.db.commit()
+        return [
+            {"product_id": row["product_id"], "quantity": row["quantity"], "expires_at": expires_at}
+            for row in rows
+        ]
+
+    def _delete_reservations(self, *conditions) -> List[Tuple[str, Optional[str], int]]:
+        """Удаляет резервы и возвращает (product_id, bucket_id, quantity) удаленных"""
+        statement = delete(StockReservation).where(*conditions).execution_options(synchronize_session=False)
+        columns = (StockReservation.product_id, StockReservation.bucket_id, StockReservation.quantity)
+        if self.db.get_bind().dialect.delete_returning:
+            return [tuple(row) for row in self.db.execute(statement.returning(*columns))]
+
+        rows = self.db.execute(select(StockReservation.id, *columns).where(*conditions).with_for_update()).all()
+        if rows:
+            self.db.execute(
+                delete(StockReservation)
+                .where(StockReservation.id.in_([row.id for row in rows]))
+                .execution_options(synchronize_session=False)
+            )
+        return [tuple(row[1:]) for row in rows]
+
+    def _return_stock(self, reservations: List[Tuple[str, Optional[str], int]], sold: bool = False) -> None:
+        """
+        Снимает резервы со счетчиков (одним UPDATE на корзину или продукт).
+        sold=True - товар продан: вместо возврата в доступный остаток уменьшается сам остаток.
+        Если корзину уже слили с продуктом, резерв снимается со строки продукта
+        """
+        totals: Dict[Tuple[str, Optional[str]], int] = defaultdict(int)
+        for product_id, bucket_id, quantity in reservations:
+            totals[(product_id, bucket_id)] += quantity
+
+        for (product_id, bucket_id), quantity in totals.items():
+            if bucket_id is not None:
+                values = {"reserved": StockBucket.reserved - quantity}
+                if sold:
+                    values["sold"] = StockBucket.sold + quantity
+                result = self.db.execute(
+                    update(StockBucket)
+                    .where(StockBucket.id == bucket_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    continue
+
+            values = {"reserved_quantity": Product.reserved_quantity - quantity}
+            if sold:
+                values["stock_quantity"] = Product.stock_quantity - quantity
+            self.db.execute(
+                update(Product)
+                .where(Product.id == product_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+    def release(self, reservation_id: str, user_id: str) -> bool:
+        """Снимает резерв пользователя и возвращает товар в доступный остаток"""
+        reservations = self._delete_reservations(
+            StockReservation.id == reservation_id,
+            StockReservation.user_id == user_id
+        )
+        self._return_stock(reservations)
+        self.db.commit()
+        return bool(reservations)
+
+    def release_user(self, user_id: str) -> int:
+        """Снимает все резервы пользователя"""
+        reservations = self._delete_reservations(StockReservation.user_id == user_id)
+        self._return_stock(reservations)
+        self.db.commit()
+        return len(reservations)
+
+    def confirm(self, reservation_id: str, user_id: str) -> bool:
+        """Списывает зарезервированный товар (продажа). Истекший резерв не списывается"""
+        reservations = self._delete_reservations(
+            StockReservation.id == reservation_id,
+            StockReservation.user_id == user_id,
+            StockReservation.expires_at > datetime.utcnow()
+        )
+        self._return_stock(reservations, sold=True)
+        self.db.commit()
+        return bool(reservations)
+
+    def confirm_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Списывает все действующие резервы пользователя (оформление заказа).
+        Возвращает проданное количество по продуктам; истекшие резервы остаются для expire
+        """
+        reservations = self._delete_reservations(
+            StockReservation.user_id == user_id,
+            StockReservation.expires_at > datetime.utcnow()
+        )
+        self._return_stock(reservations, sold=True)
+        self.db.commit()
+
+        sold: Dict[str, int] = defaultdict(int)
+        for product_id, _, quantity in reservations:
+            sold[product_id] += quantity
+        return [{"product_id": product_id, "quantity": quantity} for product_id, quantity in sold.items()]
+
+    def expire(self, batch_size: int) -> int:
+        """Снимает истекшие резервы; каждая пачка из batch_size - в отдельной короткой транзакции"""
+        expired = 0
+        while True:
+            stale = (
+                select(StockReservation.id)
+                .where(StockReservation.expires_at <= datetime.utcnow())
+                .limit(batch_size)
+            )
+            reservations = self._delete_reservations(StockReservation.id.in_(stale))
+            self._return_stock(reservations)
+            self.db.commit()
+            expired += len(reservations)
+            if len(reservations) < batch_size:
+                return expired
+
+    def _merge(self, product_id: str) -> int:
+        """Удаляет корзины продукта, возвращая их неиспользованный остаток в строку продукта"""
+        statement = delete(StockBucket).where(StockBucket.product_id == product_id)
+        columns = (StockBucket.capacity, StockBucket.reserved, StockBucket.sold)
+        if self.db.get_bind().dialect.delete_returning:
+            buckets = self.db.execute(statement.returning(*columns)).all()
+        else:
+            buckets = self.db.execute(
+                select(*columns).where(StockBucket.product_id == product_id).with_for_update()
+            ).all()
+            self.db.execute(statement)
+        if not buckets:
+            return 0
+
+        capacity = sum(bucket.capacity for bucket in buckets)
+        reserved = sum(bucket.reserved for bucket in buckets)
+        sold = sum(bucket.sold for bucket in buckets)
+        # Строка продукта забирает действующие резервы корзин и списывает проданное
+        self.db.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(
+                reserved_quantity=Product.reserved_quantity - capacity + reserved,
+                stock_quantity=Product.stock_quantity - sold
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return len(buckets)
+
+    def merge(self, product_id: str) -> int:
+        """Сливает корзины продукта обратно в строку products. Возвращает количество корзин"""
+        merged = self._merge(product_id)
+        self.db.commit()
+        return merged
+
+    def split(self, product_id: str, buckets: int) -> Optional[int]:
+        """
+        Делит доступный остаток продукта на buckets корзин (прежние корзины сначала сливаются).
+        Возвращает выделенное в корзины количество или None, если продукта нет
+        """
+        self._merge(product_id)
+        available = self.db.execute(select(product_available).where(Product.id == product_id)).scalar()
+        if available is None:
+            self.db.rollback()
+            return None
+        if available <= 0 or buckets <= 0:
+            self.db.commit()
+            return 0
+
+        result = self.db.execute(
+            update(Product)
+            .where(Product.id == product_id, product_available >= available)
+            .values(reserved_quantity=Product.reserved_quantity + available)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            # Остаток изменился между чтением и выделением
+            self.db.rollback()
+            return 0
+
+        share, remainder = divmod(available, buckets)
+        self.db.execute(insert(StockBucket), [
+            {"product_id": product_id, "bucket": bucket, "capacity": share + (1 if bucket < remainder else 0)}
+            for bucket in range(buckets)
+        ])
+        self.db.commit()
+        return available
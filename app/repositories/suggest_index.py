@@ -0,0 +1,147 @@
+import bisect
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.category import Category
+from app.models.product import Product
+
+PRODUCT = "product"
+CATEGORY = "category"
+
+# Приоритет совпадения: начало названия, начало слова внутри названия, артикул
+MATCH_TITLE = 0
+MATCH_WORD = 1
+MATCH_ARTICLE = 2
+
+# Порядок просмотра списков ключей: сначала более сильные совпадения, категории раньше продуктов
+SEARCH_ORDER = (
+    (MATCH_TITLE, CATEGORY),
+    (MATCH_TITLE, PRODUCT),
+    (MATCH_WORD, CATEGORY),
+    (MATCH_WORD, PRODUCT),
+    (MATCH_ARTICLE, PRODUCT),
+)
+
+
+def normalize(value: str) -> str:
+    """Приводит строку к виду для поиска по префиксу: без регистра и лишних пробелов"""
+    return " ".join(value.casefold().split())
+
+
+def _item_keys(title: str, article: Optional[int] = None) -> List[Tuple[str, int]]:
+    """Ключи записи: полное название, название с каждого следующего слова и артикул"""
+    words = normalize(title).split(" ")
+    keys = []
+    for position in range(len(words)):
+        key = " ".join(words[position:])
+        if key:
+            keys.append((key, MATCH_TITLE if position == 0 else MATCH_WORD))
+    if article is not None:
+        keys.append((str(article), MATCH_ARTICLE))
+    return keys
+
+
+class SuggestIndex:
+    """
+    Префиксный индекс подсказок поиска в памяти процесса: названия и артикулы продуктов,
+    названия категорий. Ключи хранятся в отсортированных списках по виду совпадения,
+    запрос - это бинарный поиск начала диапазона в каждом списке и чтение не более limit записей
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[int, str], List[Tuple[str, str]]] = {order: [] for order in SEARCH_ORDER}
+        self._items: Dict[Tuple[str, str], Tuple[str, List[Tuple[str, int]]]] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, db: Session) -> int:
+        """Загружает индекс из БД: по одному запросу на продукты и категории"""
+        items = {}
+        for product_id, title, article in db.query(Product.id, Product.title, Product.article):
+            items[(PRODUCT, product_id)] = (title, _item_keys(title, article))
+        for category_id, name in db.query(Category.id, Category.name):
+            items[(CATEGORY, category_id)] = (name, _item_keys(name))
+
+        entries = {order: [] for order in SEARCH_ORDER}
+        for (kind, item_id), (_, keys) in items.items():
+            for key, match in keys:
+                entries[(match, kind)].append((key, item_id))
+        for keys in entries.values():
+            keys.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._items = items
+            self.loaded = True
+        return len(items)
+
+    def upsert_product(self, product_id: str, title: str, article: Optional[int]) -> None:
+        self._upsert(PRODUCT, product_id, title, _item_keys(title, article))
+
+    def upsert_category(self, category_id: str, name: str) -> None:
+        self._upsert(CATEGORY, category_id, name, _item_keys(name))
+
+    def remove_product(self, product_id: str) -> None:
+        self._remove(PRODUCT, product_id)
+
+    def remove_category(self, category_id: str) -> None:
+        self._remove(CATEGORY, category_id)
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Лучшие limit подсказок для префикса query. Виды совпадений перебираются в порядке
+        SEARCH_ORDER, внутри вида - в лексикографическом порядке ключей (не по длине продолжения);
+        просмотр останавливается, как только набрано limit подсказок
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        result = []
+        seen = set()
+        with self._lock:
+            for match, kind in SEARCH_ORDER:
+                keys = self._entries[(match, kind)]
+                position = bisect.bisect_left(keys, (prefix,))
+                while position < len(keys) and len(result) < limit:
+                    key, item_id = keys[position]
+                    if not key.startswith(prefix):
+                        break
+                    if (kind, item_id) not in seen:
+                        seen.add((kind, item_id))
+                        result.append({"type": kind, "id": item_id, "title": self._items[(kind, item_id)][0]})
+                    position += 1
+                if len(result) >= limit:
+                    break
+        return result
+
+    def _upsert(self, kind: str, item_id: str, title: str, keys: List[Tuple[str, int]]) -> None:
+        if not self.loaded:
+            return
+        with self._lock:
+            self._remove_entries(kind, item_id)
+            self._items[(kind, item_id)] = (title, keys)
+            for key, match in keys:
+                bisect.insort(self._entries[(match, kind)], (key, item_id))
+
+    def _remove(self, kind: str, item_id: str) -> None:
+        if not self.loaded:
+            return
+        with self._lock:
+            self._remove_entries(kind, item_id)
+            self._items.pop((kind, item_id), None)
+
+    def _remove_entries(self, kind: str, item_id: str) -> None:
+        item = self._items.get((kind, item_id))
+        if not item:
+            return
+        for key, match in item[1]:
+            keys = self._entries[(match, kind)]
+            position = bisect.bisect_left(keys, (key, item_id))
+            if position < len(keys) and keys[position] == (key, item_id):
+                del keys[position]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,44 @@
+import threading
+from typing import Dict
+
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+
+
+class TokenVersionMap:
+    """
+    Версии токенов пользователей в памяти процесса для stateless-аутентификации.
+    Хранятся только пользователи с ненулевой версией (выходившие со всех устройств).
+    Изменения из этого процесса применяются сразу, из других - после перезагрузки фоновой задачей
+    (раз в settings.token_version_ttl_seconds).
+    Версия только растет, поэтому и set, и load оставляют большее из известного и нового значения
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def set(self, user_id: str, version: int) -> None:
+        with self._lock:
+            self._versions[user_id] = max(self._versions.get(user_id, 0), version)
+
+    def load(self, db: Session) -> int:
+        """
+        Загружает ненулевые версии одним запросом. Запрос идет вне блокировки, поэтому строки
+        сливаются с текущими версиями, а не заменяют их: set, выполненный во время запроса, не теряется
+        """
+        rows = db.query(User.id, User.token_version).filter(User.token_version > 0).all()
+        with self._lock:
+            for user_id, version in rows:
+                if version > self._versions.get(user_id, 0):
+                    self._versions[user_id] = version
+            self.loaded = True
+        return len(rows)
+
+
+token_versions = TokenVersionMap()
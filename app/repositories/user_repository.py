@@ -1,8 +1,10 @@
+from datetime import datetime
 from typing import Optional, Dict, Any
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from app.models.user import User
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash
 
 
 class UserRepository:
@@ -28,17 +30,26 @@ class UserRepository:
         self.db.refresh(user)
         return user
 
-    def authenticate(self, email: str, password: str) -> Optional[User]:
-        user = self.get_by_email(email)
-        if not user:
-            return None
-        if not user.hashed_password or not verify_password(password, user.hashed_password):
-            return None
-        return user
+    def update_password_hash(self, user: User, hashed_password: str) -> None:
+        """Сохраняет хеш пароля, пересчитанный с текущей стоимостью bcrypt"""
+        user.hashed_password = hashed_password
+        self.db.commit()
 
-    def update_last_login(self, user_id: str) -> None:
-        from datetime import datetime
+    def update_last_login(self, user_id: str, logged_in_at: Optional[datetime] = None) -> None:
+        self.db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(last_login=logged_in_at or datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+    def increment_token_version(self, user_id: str) -> Optional[int]:
+        """Делает недействительными все выданные пользователю access token"""
         user = self.get_by_id(user_id)
-        if user:
-            user.last_login = datetime.utcnow()
-            self.db.commit()
\ No newline at end of file
+        if not user:
+            return None
+        user.token_version = User.token_version + 1
+        self.db.commit()
+        self.db.refresh(user)
+        return user.token_version
@@ -1,5 +1,6 @@
+from datetime import datetime
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from uuid import UUID
 
 
@@ -17,6 +18,37 @@ class CartItemUpdate(BaseModel):
     quantity: int
 
 
+class CartItemOperation(BaseModel):
+    """Изменение позиции корзины: quantity - новое количество (0 - удалить), delta - прибавить/убавить"""
+    product_id: str
+    quantity: Optional[int] = None
+    delta: Optional[int] = None
+
+    @validator('quantity')
+    def quantity_not_negative(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('Quantity must not be negative')
+        return v
+
+    @validator('delta', always=True)
+    def quantity_or_delta(cls, v, values):
+        if (v is None) == (values.get('quantity') is None):
+            raise ValueError('Exactly one of quantity or delta must be set')
+        return v
+
+
+class CartBatchUpdate(BaseModel):
+    operations: List[CartItemOperation]
+
+    @validator('operations')
+    def operations_limit(cls, v):
+        if not v:
+            raise ValueError('At least one operation is required')
+        if len(v) > 100:
+            raise ValueError('Too many operations, maximum is 100')
+        return v
+
+
 class CartItemResponse(BaseModel):
     product_id: str
     image_url: Optional[str] = None
@@ -35,6 +67,25 @@ class CartResponse(BaseModel):
     items_count: int
 
 
+class StockReservationResponse(BaseModel):
+    product_id: str
+    quantity: int
+    expires_at: datetime
+
+
+class CartReservationResponse(BaseModel):
+    reservations: List[StockReservationResponse]
+
+
+class CheckoutItemResponse(BaseModel):
+    product_id: str
+    quantity: int
+
+
+class CartCheckoutResponse(BaseModel):
+    items: List[CheckoutItemResponse]
+
+
 class CartSummary(BaseModel):
     total_price: float
     items_count: int
\ No newline at end of file
@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, validator
 from uuid import UUID
 
 from app.schemas.product import ProductResponse
@@ -14,6 +14,22 @@ class FavoriteCreate(BaseModel):
     product_id: str
 
 
+class FavoriteCheckRequest(BaseModel):
+    product_ids: List[str]
+
+    @validator('product_ids')
+    def product_ids_limit(cls, v):
+        if not v:
+            raise ValueError('At least one product id is required')
+        if len(v) > 100:
+            raise ValueError('Too many product ids, maximum is 100')
+        return v
+
+
+class FavoriteCheckResponse(BaseModel):
+    favorites: Dict[str, bool]
+
+
 class FavoriteResponse(FavoriteBase):
     id: UUID
     # created_at: str
@@ -33,6 +49,28 @@ class FavoriteWithProductResponse(BaseModel):
         from_attributes = True
 
 
+class FavoriteProductBrief(BaseModel):
+    id: UUID
+    article: Optional[int] = None
+    title: str
+    price: float
+    stock_quantity: int = 0
+
+
+class FavoriteWithProductBriefResponse(BaseModel):
+    id: UUID
+    user_id: str
+    product_id: str
+    product: FavoriteProductBrief
+
+
 class FavoriteListResponse(BaseModel):
     favorites: List[FavoriteWithProductResponse]
-    total: int
\ No newline at end of file
+    total: int
+    next_cursor: Optional[str] = None
+
+
+class FavoriteBriefListResponse(BaseModel):
+    favorites: List[FavoriteWithProductBriefResponse]
+    total: int
+    next_cursor: Optional[str] = None
\ No newline at end of file
@@ -32,6 +32,7 @@ class ProductCreate(ProductBase):
 
 
 class ProductUpdate(BaseModel):
+    article: Optional[int] = None
     title: Optional[str] = None
     description: Optional[str] = None
     price: Optional[float] = None
@@ -56,6 +57,8 @@ class ProductResponse(ProductBase):
     id: UUID
     article: int
     category_name: Optional[str] = None
+    # Остаток за вычетом резервов; заполняется в карточке и списке продуктов
+    available_quantity: Optional[int] = None
 
     class Config:
         from_attributes = True
\ No newline at end of file
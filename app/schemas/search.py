@@ -0,0 +1,13 @@
+from typing import List
+from pydantic import BaseModel
+
+
+class SuggestItem(BaseModel):
+    type: str  # product или category
+    id: str
+    title: str
+
+
+class SuggestResponse(BaseModel):
+    query: str
+    suggestions: List[SuggestItem]
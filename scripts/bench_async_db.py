@@ -0,0 +1,145 @@
+"""
+Бенчмарк конкурентных запросов списка продуктов: синхронная сессия внутри async def
+(прежний путь, блокирует event loop) против AsyncSession через асинхронный драйвер.
+Параллельно с запросами измеряется задержка event loop - насколько опаздывает
+пробуждение корутины, которая спит по 1 мс.
+
+Запуск из корня проекта:
+    python scripts/bench_async_db.py [--products 20000] [--concurrency 50] [--requests 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base, get_async_database_url  # noqa: E402
+from app.models import cart, category, favorite, refresh_token, user  # noqa: E402,F401
+from app.models.product import Product  # noqa: E402
+from app.repositories.async_repositories import AsyncProductRepository  # noqa: E402
+from app.repositories.product_repository import ProductRepository  # noqa: E402
+
+
+def generate_products(engine, size):
+    random.seed(42)
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "article": i + 1,
+            "title": f"Product {i}",
+            "description": "description " * 10,
+            "price": round(random.uniform(1, 1000), 2),
+            "stock_quantity": random.randint(0, 100),
+            "image_urls": [],
+        }
+        for i in range(size)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Product), rows)
+
+
+def request_filters():
+    low = random.uniform(1, 900)
+    return {"min_price": low, "max_price": low + 100}
+
+
+async def sync_request(session_factory):
+    """Прежний путь: синхронная сессия прямо в корутине"""
+    db = session_factory()
+    try:
+        ProductRepository(db).get_page_with_total(20, request_filters(), "price", "asc")
+    finally:
+        db.close()
+
+
+async def async_request(session_factory):
+    """Новый путь: AsyncSession и асинхронный репозиторий"""
+    async with session_factory() as db:
+        await AsyncProductRepository(db).get_page_with_total(20, request_filters(), "price", "asc")
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - started - 0.001) * 1000)
+
+
+async def run(request, session_factory, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await request(session_factory)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    lags = []
+    monitor = asyncio.create_task(measure_loop_lag(stop, lags))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    return elapsed, latencies, lags
+
+
+def report(name, elapsed, latencies, lags, total):
+    latencies.sort()
+    lags.sort()
+    print(
+        f"{name:>6}: {total / elapsed:8.1f} req/s, "
+        f"latency p50 {statistics.median(latencies):7.2f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms; "
+        f"loop lag p50 {statistics.median(lags) if lags else 0:7.2f} ms, max {max(lags) if lags else 0:7.2f} ms "
+        f"({len(lags)} wakeups)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        engine = create_engine(database_url, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        generate_products(engine, args.products)
+
+        async_engine = create_async_engine(get_async_database_url(database_url))
+        sync_sessions = sessionmaker(autoflush=False, bind=engine)
+        async_sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        async def bench():
+            # Прогрев соединений и кэша страниц SQLite
+            await run(sync_request, sync_sessions, args.concurrency, args.concurrency)
+            await run(async_request, async_sessions, args.concurrency, args.concurrency)
+
+            print(f"{args.products} products, {args.requests} requests, concurrency {args.concurrency}")
+            report("sync", *await run(sync_request, sync_sessions, args.concurrency, args.requests), args.requests)
+            report("async", *await run(async_request, async_sessions, args.concurrency, args.requests), args.requests)
+            await async_engine.dispose()
+
+        asyncio.run(bench())
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Бенчмарк хранилищ корзины: операций в секунду для add_item, set_item_quantity,
+remove_from_cart и get_cart в режиме "sql" (каждое изменение в БД) и "memory"
+(корзины в памяти, запись в БД пачкой). Для "memory" отдельно выводится время записи в БД.
+
+Запуск из корня проекта:
+    python scripts/bench_cart_storage.py [--users 200] [--products 500] [--operations 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base  # noqa: E402
+from app.models.cart import CartItem  # noqa: E402
+from app.models.category import Category  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.repositories.cart_repository import CartRepository  # noqa: E402
+from app.repositories.cart_store import CartStore, MemoryCartRepository  # noqa: E402
+
+
+def seeded_id():
+    return str(uuid.UUID(int=random.getrandbits(128), version=4))
+
+
+def generate_data(db, users, products):
+    random.seed(1)
+    category_id = seeded_id()
+    db.execute(insert(Category), [{"id": category_id, "name": "category"}])
+    product_ids = [seeded_id() for _ in range(products)]
+    db.execute(insert(Product), [
+        {
+            "id": product_id,
+            "article": i + 1,
+            "title": f"product-{i}",
+            "price": round(random.uniform(1, 1000), 2),
+            "category_id": category_id,
+            "stock_quantity": 1000000,
+            "image_urls": []
+        }
+        for i, product_id in enumerate(product_ids)
+    ])
+    user_ids = [seeded_id() for _ in range(users)]
+    db.execute(insert(User), [{"id": user_id, "name": "user", "email": f"user{i}@example.com"} for i, user_id in enumerate(user_ids)])
+    db.commit()
+    return user_ids, product_ids
+
+
+def workload(user_ids, product_ids, operations):
+    """Одинаковая для обоих хранилищ последовательность операций: чтения и изменения поровну"""
+    random.seed(42)
+    names = ["get_cart", "get_cart", "add_item", "set_item_quantity", "remove_from_cart"]
+    return [
+        (random.choice(names), random.choice(user_ids), random.choice(product_ids[:20]), random.randint(1, 5))
+        for _ in range(operations)
+    ]
+
+
+def run(repository, calls):
+    """Секунды по каждому виду операций"""
+    elapsed = defaultdict(float)
+    counts = defaultdict(int)
+    for name, user_id, product_id, quantity in calls:
+        started = time.perf_counter()
+        if name == "get_cart":
+            repository.get_cart(user_id)
+        elif name == "add_item":
+            repository.add_item(user_id, product_id, quantity)
+        elif name == "set_item_quantity":
+            repository.set_item_quantity(user_id, product_id, quantity)
+        else:
+            repository.remove_from_cart(user_id, product_id)
+        elapsed[name] += time.perf_counter() - started
+        counts[name] += 1
+    return elapsed, counts
+
+
+def report(backend, elapsed, counts):
+    total = sum(elapsed.values())
+    print(f"{backend}: {sum(counts.values()) / total:9.0f} ops/s overall")
+    for name in sorted(counts):
+        print(f"  {name:18} {counts[name] / elapsed[name]:9.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--operations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for backend in ("sql", "memory"):
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, f'{backend}.db')}")
+            session_factory = sessionmaker(autoflush=False, bind=engine)
+            Base.metadata.create_all(bind=engine)
+
+            db = session_factory()
+            user_ids, product_ids = generate_data(db, args.users, args.products)
+            calls = workload(user_ids, product_ids, args.operations)
+
+            if backend == "sql":
+                repository = CartRepository(db)
+            else:
+                store = CartStore(session_factory, flush_interval=0, shards=16, max_users=args.users)
+                repository = MemoryCartRepository(db, store)
+            elapsed, counts = run(repository, calls)
+            report(backend, elapsed, counts)
+
+            if backend == "memory":
+                started = time.perf_counter()
+                flushed = store.flush()
+                print(f"  flush of {flushed} carts: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            db.rollback()
+            results[backend] = db.query(CartItem.user_id, CartItem.product_id, CartItem.quantity).all()
+            print(f"  cart_items rows: {len(results[backend])}")
+            db.close()
+            engine.dispose()
+
+        same = sorted(results["sql"]) == sorted(results["memory"])
+        print(f"persisted carts identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Бенчмарк получения поддерева категорий: обход дерева запросом на каждый узел
+против одного WITH RECURSIVE.
+
+Запуск из корня проекта:
+    python scripts/bench_category_subtree.py [--categories 5000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, event, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base  # noqa: E402
+from app.models import cart, favorite, refresh_token, user  # noqa: E402,F401
+from app.models.category import Category  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.repositories.category_repository import CategoryRepository  # noqa: E402
+from app.repositories.product_repository import ProductRepository  # noqa: E402
+
+
+def legacy_subcategory_ids(db, category_id):
+    """Прежняя реализация: один SELECT на каждый узел дерева"""
+
+    def get_children_ids(parent_id):
+        children = db.query(Category).filter(Category.parent_id == parent_id).all()
+        children_ids = {child.id for child in children}
+        for child in children:
+            children_ids.update(get_children_ids(child.id))
+        return children_ids
+
+    all_ids = {category_id}
+    all_ids.update(get_children_ids(category_id))
+    return all_ids
+
+
+def generate_tree(db, size, products_per_category):
+    """Генерирует дерево из size категорий: каждый узел получает случайного родителя среди уже созданных"""
+    random.seed(42)
+    root_id = str(uuid.uuid4())
+    ids = [root_id]
+    rows = [{"id": root_id, "name": "root", "parent_id": None}]
+    for i in range(1, size):
+        category_id = str(uuid.uuid4())
+        rows.append({"id": category_id, "name": f"category-{i}", "parent_id": random.choice(ids)})
+        ids.append(category_id)
+    db.execute(insert(Category), rows)
+
+    products = []
+    article = 1
+    for category_id in ids:
+        for _ in range(products_per_category):
+            products.append({
+                "id": str(uuid.uuid4()),
+                "article": article,
+                "title": f"product-{article}",
+                "price": random.uniform(1, 1000),
+                "category_id": category_id,
+                "stock_quantity": 1
+            })
+            article += 1
+    db.execute(insert(Product), products)
+    db.commit()
+    return root_id
+
+
+def measure(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categories", type=int, default=5000)
+    parser.add_argument("--products-per-category", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autoflush=False, bind=engine)()
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+        root_id = generate_tree(db, args.categories, args.products_per_category)
+        category_repo = CategoryRepository(db)
+        product_repo = ProductRepository(db)
+
+        print(f"categories={args.categories} products={args.categories * args.products_per_category}")
+
+        statements.clear()
+        legacy_ms, legacy_ids = measure(lambda: legacy_subcategory_ids(db, root_id), args.repeat)
+        legacy_statements = len(statements) // args.repeat
+
+        statements.clear()
+        cte_ms, cte_ids = measure(lambda: category_repo.get_all_subcategory_ids(root_id), args.repeat)
+        cte_statements = len(statements) // args.repeat
+
+        assert legacy_ids == cte_ids
+        print(f"subtree ids (legacy):  {legacy_ms:9.2f} ms, {legacy_statements} statements")
+        print(f"subtree ids (cte):     {cte_ms:9.2f} ms, {cte_statements} statements")
+
+        statements.clear()
+        filter_ms, page = measure(
+            lambda: product_repo.get_page_with_total(20, {"category": root_id}),
+            args.repeat
+        )
+        filter_statements = len(statements) // args.repeat
+        print(f"products page + total: {filter_ms:9.2f} ms, {filter_statements} statements, total={page['total']}")
+
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
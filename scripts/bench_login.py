@@ -0,0 +1,56 @@
+"""
+Бенчмарк стоимости входа: сколько проверок пароля bcrypt выдерживает одно ядро
+при разных стоимостях и какую стоимость выбирает калибровка под целевое время.
+
+Запуск из корня проекта:
+    python scripts/bench_login.py [--target-ms 50] [--min-rounds 10] [--max-rounds 14] [--duration 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.security import (  # noqa: E402
+    calibrate_bcrypt_rounds,
+    configure_bcrypt_rounds,
+    get_password_hash,
+    verify_password
+)
+
+
+def logins_per_second(rounds, duration):
+    """Проверки пароля в секунду в одном потоке (на одно ядро)"""
+    configure_bcrypt_rounds(rounds)
+    hashed = get_password_hash("correct horse battery staple")
+
+    verified = 0
+    started = time.perf_counter()
+    while True:
+        verify_password("correct horse battery staple", hashed)
+        verified += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            return verified / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-ms", type=float, default=50)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--duration", type=float, default=2)
+    args = parser.parse_args()
+
+    calibrated = calibrate_bcrypt_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    print(f"calibrated rounds for {args.target_ms:.0f} ms target: {calibrated}")
+
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        rate = logins_per_second(rounds, args.duration)
+        marker = "  <- calibrated" if rounds == calibrated else ""
+        print(f"rounds {rounds:2}: {rate:8.1f} logins/s per core, {1000 / rate:8.1f} ms per login{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Микробенчмарк проверки access token: полное декодирование python-jose
+(base64, HMAC, JSON) против LRU проверенных токенов.
+
+Запуск из корня проекта:
+    python scripts/bench_token_cache.py [--requests 100000] [--tokens 100]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.security import (  # noqa: E402
+    _decode_access_token,
+    create_access_token,
+    token_cache,
+    verify_access_token
+)
+
+
+def measure(verify, tokens, requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        if verify(tokens[i % len(tokens)]) is None:
+            raise RuntimeError("token rejected")
+    return (time.perf_counter() - started) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--tokens", type=int, default=100, help="number of distinct clients")
+    args = parser.parse_args()
+
+    tokens = [
+        create_access_token({
+            "id": str(uuid.uuid4()),
+            "email": f"user{i}@example.com",
+            "name": f"User {i}",
+            "phone": None,
+            "is_superuser": False,
+            "token_version": 0
+        })
+        for i in range(args.tokens)
+    ]
+
+    uncached = measure(_decode_access_token, tokens, args.requests)
+    token_cache.clear()
+    cached = measure(verify_access_token, tokens, args.requests)
+    stats = token_cache.stats()
+
+    print(f"{args.requests} verifications over {args.tokens} tokens")
+    print(f"python-jose decode: {uncached:8.2f} us per request")
+    print(f"verified LRU:       {cached:8.2f} us per request "
+          f"({uncached / cached:.1f}x, hits {stats['hits']}, misses {stats['misses']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Планы запросов репозиториев (SQLite EXPLAIN QUERY PLAN) до и после миграций индексов.
+Запросы перехватываются при вызове методов репозиториев на сгенерированных данных,
+затем для каждого выводится план на схеме без индексов миграций и после их применения.
+
+Запуск из корня проекта:
+    python scripts/explain_queries.py [--users 200] [--products 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, event, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base  # noqa: E402
+from app.database.migrations import MIGRATION_INDEXES, run_migrations, schema_migrations  # noqa: E402
+from app.models.cart import CartItem  # noqa: E402
+from app.models.category import Category  # noqa: E402
+from app.models.favorite import Favorite  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.refresh_token import RefreshToken  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.repositories.cart_repository import CartRepository  # noqa: E402
+from app.repositories.favorite_repository import FavoriteRepository  # noqa: E402
+from app.repositories.product_repository import ProductRepository  # noqa: E402
+from app.repositories.refresh_token_repository import RefreshTokenRepository  # noqa: E402
+from app.repositories.user_repository import UserRepository  # noqa: E402
+
+
+def generate_data(db, users, products):
+    random.seed(42)
+    category_ids = [str(uuid.uuid4()) for _ in range(20)]
+    db.execute(insert(Category), [{"id": category_id, "name": f"category-{i}"} for i, category_id in enumerate(category_ids)])
+
+    product_ids = [str(uuid.uuid4()) for _ in range(products)]
+    db.execute(insert(Product), [
+        {
+            "id": product_id,
+            "article": i + 1,
+            "title": f"product-{random.randint(0, products)}",
+            "price": round(random.uniform(1, 1000), 2),
+            "category_id": random.choice(category_ids),
+            "stock_quantity": 10,
+            "image_urls": []
+        }
+        for i, product_id in enumerate(product_ids)
+    ])
+
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    db.execute(insert(User), [{"id": user_id, "name": "user", "email": f"user{i}@example.com"} for i, user_id in enumerate(user_ids)])
+
+    favorites, cart_items, tokens = [], [], []
+    for user_id in user_ids:
+        for product_id in random.sample(product_ids, 20):
+            favorites.append({"id": str(uuid.uuid4()), "user_id": user_id, "product_id": product_id})
+            cart_items.append({"id": str(uuid.uuid4()), "user_id": user_id, "product_id": product_id, "quantity": 1})
+        for _ in range(5):
+            tokens.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "token": str(uuid.uuid4()),
+                "expires_at": datetime.utcnow() + timedelta(days=random.randint(-60, 30)),
+                "is_revoked": False
+            })
+    db.execute(insert(Favorite), favorites)
+    db.execute(insert(CartItem), cart_items)
+    db.execute(insert(RefreshToken), tokens)
+    db.commit()
+    return user_ids[0], product_ids[0], category_ids[0]
+
+
+def repository_calls(user_id, product_id, category_id):
+    return [
+        ("UserRepository.get_by_email", lambda db: UserRepository(db).get_by_email("user0@example.com")),
+        ("FavoriteRepository.get_by_user_and_product",
+         lambda db: FavoriteRepository(db).get_by_user_and_product(user_id, product_id)),
+        ("FavoriteRepository.get_user_favorites_with_products",
+         lambda db: FavoriteRepository(db).get_user_favorites_with_products(user_id)),
+        ("FavoriteRepository.get_favorites_page (next page, brief)",
+         lambda db: FavoriteRepository(db).get_favorites_page(
+             user_id, 5, FavoriteRepository(db).get_favorites_page(user_id, 5)["next_cursor"], "brief")),
+        ("CartRepository.get_by_user_and_product",
+         lambda db: CartRepository(db).get_by_user_and_product(user_id, product_id)),
+        ("CartRepository.get_cart",
+         lambda db: CartRepository(db).get_cart(user_id)),
+        ("ProductRepository.get_page_with_total (category, price)",
+         lambda db: ProductRepository(db).get_page_with_total(20, {"category": category_id}, "price", "asc")),
+        ("ProductRepository.get_page_with_total (price range)",
+         lambda db: ProductRepository(db).get_page_with_total(20, {"min_price": 100, "max_price": 120}, "price")),
+        ("ProductRepository.get_page_with_total (title, cursor)",
+         lambda db: ProductRepository(db).get_page_with_total(20, None, "title", "asc", cursor="")),
+        ("RefreshTokenRepository.purge",
+         lambda db: RefreshTokenRepository(db).purge(timedelta(days=1), 1000)),
+    ]
+
+
+def capture_statements(engine, session_factory, calls):
+    """Выполняет вызовы и запоминает их SELECT/UPDATE/DELETE запросы с параметрами"""
+    captured = []
+    current = {}
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split()[0].upper() in ("SELECT", "UPDATE", "DELETE", "WITH"):
+            captured.append((current["name"], statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", listener)
+    for name, call in calls:
+        current["name"] = name
+        db = session_factory()
+        try:
+            call(db)
+            db.rollback()
+        finally:
+            db.close()
+    event.remove(engine, "before_cursor_execute", listener)
+    return captured
+
+
+def query_plans(engine, statements):
+    plans = []
+    with engine.connect() as connection:
+        for _, statement, parameters in statements:
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append([row[-1] for row in rows])
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'explain.db')}")
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+
+        # Схема до миграций: таблицы без индексов, которые добавляют миграции
+        Base.metadata.create_all(bind=engine)
+        for indexes in MIGRATION_INDEXES.values():
+            for index in indexes:
+                index.drop(engine, checkfirst=True)
+        schema_migrations.drop(engine, checkfirst=True)
+
+        db = session_factory()
+        calls = repository_calls(*generate_data(db, args.users, args.products))
+        db.close()
+
+        statements = capture_statements(engine, session_factory, calls)
+        before = query_plans(engine, statements)
+        print(f"applied migrations: {run_migrations(engine)}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+        after = query_plans(engine, statements)
+
+        for (name, statement, _), plan_before, plan_after in zip(statements, before, after):
+            print(f"\n== {name}")
+            print("   " + " ".join(statement.split())[:160])
+            print("   before:")
+            for line in plan_before:
+                print(f"     {line}")
+            print("   after:")
+            for line in plan_after:
+                print(f"     {line}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Перестраивает полнотекстовый индекс продуктов для существующей базы.
+
+Запуск из корня проекта:
+    python scripts/rebuild_search_index.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.database.database import engine  # noqa: E402
+from app.database.fts import setup_product_search, rebuild_product_search  # noqa: E402
+
+
+def main():
+    if not setup_product_search(engine):
+        print("Full-text search is not available for this database, ILIKE search is used")
+        return 1
+
+    with engine.begin() as connection:
+        indexed = rebuild_product_search(connection)
+
+    print(f"Indexed {indexed} products")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
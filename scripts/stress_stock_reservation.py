@@ -0,0 +1,162 @@
+"""
+Нагрузочная проверка резервирования остатков: много потоков одновременно резервируют,
+снимают и списывают один и тот же продукт. В конце корзины сливаются с продуктом
+и проверяется, что продано не больше остатка, а счетчики сходятся с резервами в БД.
+Без --buckets все резервы идут в строку products, с --buckets N - в N строк stock_buckets.
+
+Запуск из корня проекта:
+    python scripts/stress_stock_reservation.py [--threads 16] [--attempts 200] [--stock 1000] [--buckets 8]
+        [--database-url postgresql://...]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, insert, func  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base  # noqa: E402
+from app.models.category import Category  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.stock_reservation import StockReservation  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.repositories.stock_reservation_repository import StockReservationRepository  # noqa: E402
+
+TTL = timedelta(minutes=10)
+
+
+def with_retry(session_factory, call, counters, lock):
+    """Выполняет call(repository); SQLite отвечает 'database is locked' на конкурентную запись - повтор"""
+    while True:
+        db = session_factory()
+        try:
+            return call(StockReservationRepository(db))
+        except OperationalError:
+            db.rollback()
+            with lock:
+                counters["retries"] += 1
+            time.sleep(random.uniform(0, 0.005))
+        finally:
+            db.close()
+
+
+def worker(session_factory, user_id, product_id, attempts, counters, lock):
+    rng = random.Random(user_id)
+    for _ in range(attempts):
+        quantity = rng.randint(1, 2)
+        reservation_id = with_retry(
+            session_factory,
+            lambda repo: repo.reserve(user_id, product_id, quantity, TTL),
+            counters, lock
+        )
+        if reservation_id is None:
+            with lock:
+                counters["rejected"] += 1
+            continue
+
+        action = rng.random()
+        if action < 0.3:
+            with_retry(session_factory, lambda repo: repo.release(reservation_id, user_id), counters, lock)
+            outcome = "released"
+        elif action < 0.6:
+            with_retry(session_factory, lambda repo: repo.confirm(reservation_id, user_id), counters, lock)
+            outcome = "sold"
+        else:
+            outcome = "held"
+        with lock:
+            counters["reserved"] += 1
+            counters[outcome] += quantity
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--buckets", type=int, default=0)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        connect_args = {"check_same_thread": False, "timeout": 30} if database_url.startswith("sqlite") else {}
+        engine = create_engine(database_url, connect_args=connect_args, pool_size=args.threads)
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        product_id = str(uuid.uuid4())
+        user_ids = [str(uuid.uuid4()) for _ in range(args.threads)]
+        db = session_factory()
+        category_id = str(uuid.uuid4())
+        db.execute(insert(Category), [{"id": category_id, "name": f"stress-{category_id}"}])
+        db.execute(insert(Product), [{
+            "id": product_id,
+            "title": "hot product",
+            "price": 1.0,
+            "category_id": category_id,
+            "stock_quantity": args.stock,
+            "image_urls": []
+        }])
+        db.execute(insert(User), [
+            {"id": user_id, "name": "user", "email": f"{user_id}@example.com"} for user_id in user_ids
+        ])
+        db.commit()
+        if args.buckets:
+            StockReservationRepository(db).split(product_id, args.buckets)
+        db.close()
+
+        counters = {"reserved": 0, "rejected": 0, "retries": 0, "released": 0, "sold": 0, "held": 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(session_factory, user_id, product_id, args.attempts, counters, lock))
+            for user_id in user_ids
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        db = session_factory()
+        repo = StockReservationRepository(db)
+        available = repo.get_available(product_id)
+        repo.merge(product_id)
+        product = db.query(Product.stock_quantity, Product.reserved_quantity).filter(Product.id == product_id).one()
+        held = db.query(func.coalesce(func.sum(StockReservation.quantity), 0)).filter(
+            StockReservation.product_id == product_id
+        ).scalar()
+        db.close()
+        engine.dispose()
+
+    attempts = args.threads * args.attempts
+    print(f"{args.threads} threads x {args.attempts} attempts, stock {args.stock}, buckets {args.buckets}")
+    print(f"  {attempts / elapsed:8.0f} reservation attempts/s, {counters['retries']} lock retries")
+    print(f"  reserved {counters['reserved']}, rejected {counters['rejected']}")
+    print(f"  units sold {counters['sold']}, held {counters['held']}, released {counters['released']}")
+    print(f"  product after merge: stock {product.stock_quantity}, reserved {product.reserved_quantity}, "
+          f"available before merge {available}")
+
+    checks = {
+        "no oversell": counters["sold"] + counters["held"] <= args.stock,
+        "stock decreased by sold units": product.stock_quantity == args.stock - counters["sold"],
+        "reserved counter matches held reservations": product.reserved_quantity == held == counters["held"],
+        "available matches counters": available == args.stock - counters["sold"] - counters["held"],
+    }
+    for name, passed in checks.items():
+        print(f"  {'OK  ' if passed else 'FAIL'} {name}")
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()